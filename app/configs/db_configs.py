@@ -1,6 +1,14 @@
 import os
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
 
 DATABASE_URI = os.getenv("DATABASE_URI")
+ASYNC_DATABASE_URI = make_url(DATABASE_URI).set(drivername="postgresql+asyncpg") if DATABASE_URI else None
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
 
 Base = declarative_base()
@@ -0,0 +1,28 @@
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import APIKeyHeader
+
+from .db_connection import DatabaseDependency
+from ..utils.device_cache import CameraSnapshot, SensorSnapshot, camera_key_cache, load_camera, load_sensor, \
+    sensor_key_cache
+
+api_key_scheme = APIKeyHeader(name='api_key')
+
+
+async def get_current_camera(db: DatabaseDependency, api_key: str = Depends(api_key_scheme)):
+    camera = await camera_key_cache.lookup(api_key, lambda: load_camera(db, api_key))
+    if not camera:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid API key')
+    return camera
+
+
+async def get_current_sensor(db: DatabaseDependency, api_key: str = Depends(api_key_scheme)):
+    sensor = await sensor_key_cache.lookup(api_key, lambda: load_sensor(db, api_key))
+    if not sensor:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid API key')
+    return sensor
+
+
+CurrentCameraDependency = Annotated[CameraSnapshot, Depends(get_current_camera)]
+CurrentSensorDependency = Annotated[SensorSnapshot, Depends(get_current_sensor)]
@@ -1,19 +1,32 @@
 from typing import Annotated
 from fastapi import Depends
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
-from ..configs.db_configs import DATABASE_URI, Base
-engine = create_engine(DATABASE_URI)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(engine)
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from ..configs.db_configs import ASYNC_DATABASE_URI, Base, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, \
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING
+from ..utils.metrics import DB_POOL_CHECKED_OUT, InstrumentedAsyncAdaptedQueuePool
+engine = create_async_engine(
+    ASYNC_DATABASE_URI,
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+DB_POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout())
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-DatabaseDependency = Annotated[Session, Depends(get_db)]
+DatabaseDependency = Annotated[AsyncSession, Depends(get_db)]
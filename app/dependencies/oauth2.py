@@ -3,27 +3,40 @@ from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+from redis import asyncio as aioredis
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .db_connection import DatabaseDependency
-from ..models.models import User
 from ..utils.jwt import verify_jwt_token
+from ..utils.token_cache import UserSnapshot, token_cache
 from .redis_connection import RedisDependency
 
 auth_scheme = OAuth2PasswordBearer(tokenUrl='login')
 
 
-def get_current_user(redis_client: RedisDependency, db: DatabaseDependency, token: str = Depends(auth_scheme)):
+async def authenticate_token(token: str, redis_client: aioredis.Redis, db: AsyncSession) -> UserSnapshot:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached[1]
     try:
-        return verify_jwt_token(token, secret_key=os.getenv('JWT_ACCESS_SECRET_KEY'), db=db, redis_client=redis_client)
-    except Exception as e:
-        print(e)
+        user = await verify_jwt_token(token, secret_key=os.getenv('JWT_ACCESS_SECRET_KEY'), db=db,
+                                      redis_client=redis_client)
+    except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+    user_snapshot = UserSnapshot.from_user(user)
+    token_cache.set(token, jwt.get_unverified_claims(token), user_snapshot)
+    return user_snapshot
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_user(redis_client: RedisDependency, db: DatabaseDependency, token: str = Depends(auth_scheme)):
+    return await authenticate_token(token, redis_client, db)
+
+
+async def get_current_active_user(current_user: UserSnapshot = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Inactive user')
     return current_user
 
 
-CurrentActiveUserDependency = Annotated[User, Depends(get_current_active_user)]
+CurrentActiveUserDependency = Annotated[UserSnapshot, Depends(get_current_active_user)]
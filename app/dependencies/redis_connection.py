@@ -1,16 +1,36 @@
 import os
 from typing import Annotated
 
-import redis
 from fastapi import Depends
+from redis import asyncio as aioredis
 
+from ..utils.metrics import InstrumentedRedis
 
-def get_redis():
-    r = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'))
-    try:
-        yield r
-    finally:
-        r.close()
+redis_pool = None
 
 
-RedisDependency = Annotated[redis.Redis, Depends(get_redis)]
+def init_redis_pool():
+    global redis_pool
+    redis_pool = aioredis.BlockingConnectionPool(
+        host=os.getenv('REDIS_HOST'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 100)),
+        timeout=int(os.getenv('REDIS_POOL_TIMEOUT', 5)),
+    )
+    return redis_pool
+
+
+async def close_redis_pool():
+    global redis_pool
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+        redis_pool = None
+
+
+def get_redis() -> aioredis.Redis:
+    if redis_pool is None:
+        init_redis_pool()
+    return InstrumentedRedis(connection_pool=redis_pool)
+
+
+RedisDependency = Annotated[aioredis.Redis, Depends(get_redis)]
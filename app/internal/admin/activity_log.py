@@ -1,22 +1,26 @@
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Query, status, HTTPException
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from fastapi import APIRouter, Depends, Query, status, HTTPException
+from sqlalchemy import select
 
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
 from app.models.models import ActivityLog, Vehicle
+from app.models.loaders import activity_log_admin_out_options
 from app.models.schemas import ActivityLogAdminOut
+from app.utils.license_plates import normalize_license_plate
+from app.utils.pagination import CursorPage, CursorParams, paginate_by_keyset
+from app.utils.serialization import json_response
 
 router = APIRouter(prefix='/activity_logs')
 
 
-@router.get('/', response_model=Page[ActivityLogAdminOut], status_code=status.HTTP_200_OK)
-def get_activity_logs(
+@router.get('/', response_model=CursorPage[ActivityLogAdminOut], status_code=status.HTTP_200_OK)
+async def get_activity_logs(
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
+        params: CursorParams = Depends(),
         fromtime: int = Query(default=0, ge=0),
         totime: int = Query(default_factory=lambda: int(datetime.utcnow().timestamp()), ge=0),
         sort: str = Query(default='desc', regex='^(desc|asc)$'),
@@ -27,17 +31,20 @@ def get_activity_logs(
         return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
     from_timestamp = datetime.fromtimestamp(fromtime)
     to_timestamp = datetime.fromtimestamp(totime)
-    order_by = ActivityLog.timestamp.desc() if sort == 'desc' else ActivityLog.timestamp.asc()
-    query = db.query(ActivityLog) \
-              .filter(from_timestamp <= ActivityLog.timestamp,
-                      ActivityLog.timestamp <= to_timestamp)
+    query = select(ActivityLog) \
+        .options(*activity_log_admin_out_options) \
+        .where(from_timestamp <= ActivityLog.timestamp,
+               ActivityLog.timestamp <= to_timestamp)
+    if user_id is not None or license_plate is not None:
+        query = query.join(ActivityLog.vehicle)
     if user_id is not None:
-        query = query.join(ActivityLog.vehicle).filter(Vehicle.owner_id == user_id)
+        query = query.where(Vehicle.owner_id == user_id)
     if parking_lot_id is not None:
-        query = query.filter(ActivityLog.parking_lot_id == parking_lot_id)
+        query = query.where(ActivityLog.parking_lot_id == parking_lot_id)
     if license_plate is not None:
-        query = query.join(ActivityLog.vehicle).filter(Vehicle.license_plate.ilike(license_plate.lower()))
-    results = paginate(query.order_by(order_by))
-    if not results.items:
+        query = query.where(Vehicle.normalized_license_plate == normalize_license_plate(license_plate))
+    results = await paginate_by_keyset(db, query, params, [ActivityLog.timestamp, ActivityLog.id],
+                                       descending=sort == 'desc')
+    if not results['items']:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(CursorPage[ActivityLogAdminOut], results)
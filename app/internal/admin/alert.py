@@ -0,0 +1,60 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.dependencies.db_connection import DatabaseDependency
+from app.dependencies.oauth2 import CurrentActiveUserDependency
+from app.models.models import Alert
+from app.models.schemas import AlertOut
+from app.utils.alerts import alert_hub, alert_messages
+from app.utils.pagination import CursorPage, CursorParams, paginate_by_keyset
+from app.utils.serialization import json_response, serialize
+
+router = APIRouter(prefix='/alerts')
+
+
+@router.get('/', response_model=CursorPage[AlertOut], status_code=status.HTTP_200_OK)
+async def get_alerts(
+        current_active_user: CurrentActiveUserDependency,
+        db: DatabaseDependency,
+        params: CursorParams = Depends(),
+        vehicle_id: Optional[int] = Query(default=None),
+        parking_lot_id: Optional[int] = Query(default=None)
+):
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    query = select(Alert)
+    if vehicle_id is not None:
+        query = query.where(Alert.vehicle_id == vehicle_id)
+    if parking_lot_id is not None:
+        query = query.where(Alert.parking_lot_id == parking_lot_id)
+    results = await paginate_by_keyset(db, query, params, [Alert.id])
+    if not results['items']:
+        raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    return json_response(CursorPage[AlertOut], results)
+
+
+@router.get('/events', status_code=status.HTTP_200_OK)
+async def stream_alerts(
+        current_active_user: CurrentActiveUserDependency,
+        db: DatabaseDependency,
+        last_event_id: Optional[int] = Header(default=None)
+):
+    # Each event carries the alert id, so a client reconnecting with Last-Event-ID gets the alerts it missed
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    subscription = alert_hub.subscribe()
+
+    async def events():
+        try:
+            async for alert in alert_messages(db, subscription, last_event_id):
+                if alert is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield f"id: {alert['id']}\nevent: alert\ndata: {serialize(AlertOut, alert).decode('utf8')}\n\n"
+        finally:
+            alert_hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
@@ -1,29 +1,53 @@
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 
 from fastapi import APIRouter, status, Query, HTTPException
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import select
 
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
-from app.models.schemas import ParkingLotAdminOut
+from app.dependencies.redis_connection import RedisDependency
+from app.models.schemas import ParkingLotAdminOut, ParkingLotStatsOut
 from app.models.models import ParkingLot
+from app.utils.pagination import CachedTotal, Page, paginate_with_total
+from app.utils.stats import get_parking_lot_stats
+from app.utils.serialization import json_response
 
 router = APIRouter(prefix='/parking_lots')
 
 
 @router.get('/', response_model=Page[ParkingLotAdminOut], status_code=status.HTTP_200_OK)
-def get_all_parking_lots(
+async def get_all_parking_lots(
         db: DatabaseDependency,
         current_active_user: CurrentActiveUserDependency,
+        redis_client: RedisDependency,
         show_deleted: Optional[bool] = Query(default=False),
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    query = db.query(ParkingLot)
+    query = select(ParkingLot)
     if not show_deleted:
-        query = query.filter(ParkingLot.is_active == True)
-    results = paginate(query)
+        query = query.where(ParkingLot.is_active == True)
+    results = await paginate_with_total(db, query, CachedTotal(redis_client, 'admin_parking_lots',
+                                                                {'show_deleted': show_deleted}))
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    return json_response(Page[ParkingLotAdminOut], results)
+
+
+@router.get('/{parking_lot_id}/stats', response_model=List[ParkingLotStatsOut], status_code=status.HTTP_200_OK)
+async def get_parking_lot_stats_by_id(
+        parking_lot_id: int,
+        db: DatabaseDependency,
+        current_active_user: CurrentActiveUserDependency,
+        fromtime: int = Query(default=0, ge=0, alias='from'),
+        totime: int = Query(default_factory=lambda: int(datetime.utcnow().timestamp()), ge=0, alias='to'),
+        granularity: str = Query(default='hour', regex='^(hour|day|week|month)$'),
+):
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    results = await get_parking_lot_stats(db, parking_lot_id, datetime.fromtimestamp(fromtime),
+                                          datetime.fromtimestamp(totime), granularity)
+    if not results:
+        raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
     return results
@@ -1,22 +1,25 @@
 from typing import Optional
 
 from fastapi import APIRouter, status, Query, HTTPException
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
+from app.dependencies.redis_connection import RedisDependency
 from app.models.models import RatingFeedback
+from app.models.loaders import rating_feedback_out_options
 from app.models.schemas import RatingFeedbackAdminOut
+from app.utils.pagination import CachedTotal, EstimatedTotal, Page, paginate_with_total
+from app.utils.serialization import json_response
 
 router = APIRouter(prefix='/ratings_feedbacks')
 
 
 @router.get('/', response_model=Page[RatingFeedbackAdminOut], status_code=status.HTTP_200_OK)
-def get_rating_feedbacks(
+async def get_rating_feedbacks(
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         show_deleted: Optional[bool] = Query(default=False),
         sort: str = Query(default='desc', regex='^(desc|asc)$'),
         order: str = Query(default='creation', regex='^(creation|rating)$'),
@@ -24,15 +27,17 @@ def get_rating_feedbacks(
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    query = db.query(RatingFeedback)
+    query = select(RatingFeedback).options(*rating_feedback_out_options)
     if not show_deleted:
-        query = query.filter(RatingFeedback.is_active == True)
+        query = query.where(RatingFeedback.is_active == True)
     if user_id is not None:
-        query = query.filter(RatingFeedback.user_id == user_id)
+        query = query.where(RatingFeedback.user_id == user_id)
     sort_condition = func.coalesce(RatingFeedback.updated_at, RatingFeedback.created_at) if order == 'creation' \
         else RatingFeedback.rating
     order_by = sort_condition.desc() if sort == 'desc' else sort_condition.asc()
-    results = paginate(query.order_by(order_by))
+    total = EstimatedTotal('rating_feedbacks') if show_deleted and user_id is None \
+        else CachedTotal(redis_client, 'admin_rating_feedbacks', {'show_deleted': show_deleted, 'user_id': user_id})
+    results = await paginate_with_total(db, query.order_by(order_by), total)
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(Page[RatingFeedbackAdminOut], results)
@@ -1,20 +1,27 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import APIRouter, status, Query, HTTPException
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import func, literal_column, select
 
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
+from app.dependencies.redis_connection import RedisDependency
 from app.models.models import Vehicle
-from app.models.schemas import VehicleAdminOut
+from app.models.loaders import vehicle_admin_out_options
+from app.models.schemas import VehicleAdminOut, VehicleSearchOut
+from app.utils.license_plates import LICENSE_PLATE_SIMILARITY_THRESHOLD, match_distance, normalize_license_plate
+from app.utils.pagination import EstimatedTotal, ExactTotal, Page, paginate_with_total
+from app.utils.serialization import json_response
+from app.utils.watchlist import watchlist_changed
 
 router = APIRouter(prefix='/vehicles')
 
+SEARCH_CANDIDATES = 200
+
 
 @router.get('/', response_model=Page[VehicleAdminOut], status_code=status.HTTP_200_OK)
-def get_vehicles(
+async def get_vehicles(
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
         user_id: Optional[int] = Query(default=None),
@@ -22,31 +29,85 @@ def get_vehicles(
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    query = db.query(Vehicle)
+    query = select(Vehicle).options(*vehicle_admin_out_options)
     if user_id is not None:
-        query = query.filter(Vehicle.owner_id == user_id)
+        query = query.where(Vehicle.owner_id == user_id)
     if license_plate is not None:
-        query = query.filter(Vehicle.license_plate == license_plate)
-    results = paginate(query)
+        query = query.where(Vehicle.normalized_license_plate == normalize_license_plate(license_plate))
+    # Both filters are selective and indexed, so only the unfiltered listing needs an estimate
+    total = EstimatedTotal('vehicles') if user_id is None and license_plate is None else ExactTotal()
+    results = await paginate_with_total(db, query, total)
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(Page[VehicleAdminOut], results)
+
+
+@router.get('/search', response_model=List[VehicleSearchOut], status_code=status.HTTP_200_OK)
+async def search_vehicles(
+        current_active_user: CurrentActiveUserDependency,
+        db: DatabaseDependency,
+        q: str = Query(min_length=1, max_length=32),
+        max_distance: int = Query(default=2, ge=0, le=4),
+        limit: int = Query(default=20, ge=1, le=100)
+):
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    normalized_query = normalize_license_plate(q)
+    if not normalized_query:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Query must contain letters or digits')
+    # normalized_query only contains letters and digits and is inlined so that the planner can use the pattern index
+    candidates = {vehicle.id: vehicle for vehicle in await db.scalars(
+        select(Vehicle).options(*vehicle_admin_out_options)
+        .where(Vehicle.normalized_license_plate.like(literal_column(f"'{normalized_query}%'")))
+        .order_by(Vehicle.normalized_license_plate)
+        .limit(limit)
+    )}
+    # Trigrams of shorter queries match too much of the table to be worth it
+    if max_distance > 0 and len(normalized_query) >= 3:
+        await db.execute(select(func.set_config('pg_trgm.similarity_threshold',
+                                                str(LICENSE_PLATE_SIMILARITY_THRESHOLD), True)))
+        for vehicle in await db.scalars(
+                select(Vehicle).options(*vehicle_admin_out_options)
+                .where(Vehicle.normalized_license_plate.op('%')(normalized_query))
+                .order_by(func.similarity(Vehicle.normalized_license_plate, normalized_query).desc())
+                .limit(SEARCH_CANDIDATES)):
+            candidates.setdefault(vehicle.id, vehicle)
+    ranked = sorted(
+        ((match_distance(normalized_query, vehicle.normalized_license_plate), vehicle)
+         for vehicle in candidates.values()),
+        key=lambda item: (item[0], abs(len(item[1].normalized_license_plate) - len(normalized_query)),
+                          item[1].license_plate)
+    )
+    results = [{
+        'id': vehicle.id,
+        'license_plate': vehicle.license_plate,
+        'vehicle_type': vehicle.vehicle_type,
+        'created_at': vehicle.created_at,
+        'updated_at': vehicle.updated_at,
+        'is_tracked': vehicle.is_tracked,
+        'owner': vehicle.owner,
+        'distance': distance
+    } for distance, vehicle in ranked if distance <= max_distance][:limit]
+    if not results:
+        raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    return json_response(List[VehicleSearchOut], results)
 
 
 @router.put('/track/{vehicle_id}', response_model=VehicleAdminOut, status_code=status.HTTP_200_OK)
-def track_vehicles(
+async def track_vehicles(
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         vehicle_id: int,
         track: bool
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+    vehicle = await db.scalar(select(Vehicle).options(*vehicle_admin_out_options).where(Vehicle.id == vehicle_id))
     if vehicle is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Vehicle not found')
     vehicle.is_tracked = track
     vehicle.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(vehicle)
+    await db.commit()
+    await watchlist_changed(redis_client, vehicle.id, track)
     return vehicle
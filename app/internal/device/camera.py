@@ -1,15 +1,25 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Query, HTTPException, status
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import insert, select
 
+from app.dependencies.api_key import CurrentCameraDependency
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
-from app.models.models import Camera
-from app.models.schemas import CameraOut, CameraCreateOut, CameraCreate
+from app.dependencies.redis_connection import RedisDependency
+from app.models.models import ActivityLog, Camera, ParkingLot, Vehicle
+from app.models.schemas import BulkCreateOut, CameraBulkItemOut, CameraOut, CameraCreateOut, CameraCreate, \
+    CamerasBulkCreate, PlateReadsIn, PlateReadsOut
+from app.utils.alerts import add_tracked_vehicle_alerts, publish_alerts
+from app.utils.bulk import RowError, check_bulk_size, insert_returning
+from app.utils.device_cache import device_added, device_removed, devices_added
+from app.utils.license_plates import normalize_license_plate
+from app.utils.outbox import activity_log_event, add_outbox_events
+from app.utils.pagination import CachedTotal, Page, paginate_with_total
+from app.utils.stats import record_activity_stats
+from app.utils.serialization import json_response
 
 router = APIRouter(
     prefix='/cameras',
@@ -18,66 +28,171 @@ router = APIRouter(
 
 
 @router.get('/', response_model=Page[CameraOut], status_code=status.HTTP_200_OK)
-def get_all_cameras(
+async def get_all_cameras(
         db: DatabaseDependency,
         current_active_user: CurrentActiveUserDependency,
+        redis_client: RedisDependency,
         show_deleted: bool = Query(default=False),
         parking_lot_id: Optional[int] = Query(default=None),
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    query = db.query(Camera)
+    query = select(Camera)
     if not show_deleted:
-        query = query.filter(Camera.is_active == True)
+        query = query.where(Camera.is_active == True)
     if parking_lot_id is not None:
-        query = query.filter(Camera.parking_lot_id == parking_lot_id)
-    results = paginate(query)
+        query = query.where(Camera.parking_lot_id == parking_lot_id)
+    results = await paginate_with_total(db, query, CachedTotal(redis_client, 'cameras', {
+        'show_deleted': show_deleted,
+        'parking_lot_id': parking_lot_id
+    }))
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(Page[CameraOut], results)
+
+
+@router.post('/readings', response_model=PlateReadsOut, status_code=status.HTTP_200_OK)
+async def ingest_plate_reads(
+        plate_reads: PlateReadsIn,
+        db: DatabaseDependency,
+        redis_client: RedisDependency,
+        current_camera: CurrentCameraDependency
+):
+    now = datetime.utcnow()
+    normalized_license_plates = {normalize_license_plate(read.license_plate) for read in plate_reads.reads}
+    vehicles = (await db.execute(select(Vehicle.license_plate, Vehicle.normalized_license_plate, Vehicle.id)
+                                 .where(Vehicle.normalized_license_plate.in_(normalized_license_plates)))).all()
+    vehicle_ids = {vehicle.license_plate: vehicle.id for vehicle in vehicles}
+    license_plates = {vehicle.id: vehicle.license_plate for vehicle in vehicles}
+    # A read that differs from the registered plate only by confusable characters is matched through the normalised
+    # plate, unless several vehicles share it
+    normalized_vehicle_ids = {}
+    for vehicle in vehicles:
+        normalized_vehicle_ids.setdefault(vehicle.normalized_license_plate, []).append(vehicle.id)
+    activity_logs = []
+    unmatched_license_plates = set()
+    for read in plate_reads.reads:
+        vehicle_id = vehicle_ids.get(read.license_plate)
+        if vehicle_id is None:
+            candidates = normalized_vehicle_ids.get(normalize_license_plate(read.license_plate), [])
+            vehicle_id = candidates[0] if len(candidates) == 1 else None
+        if vehicle_id is None:
+            unmatched_license_plates.add(read.license_plate)
+            continue
+        timestamp = read.timestamp
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        timestamp = min(timestamp, now)
+        activity_logs.append({
+            'activity_type': read.activity_type.value,
+            'vehicle_id': vehicle_id,
+            'timestamp': timestamp,
+            'parking_lot_id': current_camera.parking_lot_id
+        })
+    if activity_logs:
+        inserted = (await db.execute(insert(ActivityLog).values(activity_logs).returning(
+            ActivityLog.id, ActivityLog.activity_type, ActivityLog.vehicle_id, ActivityLog.parking_lot_id,
+            ActivityLog.timestamp
+        ))).all()
+        await record_activity_stats(db, current_camera.parking_lot_id, activity_logs)
+        await add_outbox_events(db, [activity_log_event(activity_log) for activity_log in inserted])
+        alerts = await add_tracked_vehicle_alerts(db, activity_logs, license_plates)
+        await db.commit()
+        await publish_alerts(redis_client, alerts)
+    return {
+        'received': len(plate_reads.reads),
+        'inserted': len(activity_logs),
+        'unmatched_license_plates': sorted(unmatched_license_plates)
+    }
 
 
 @router.get('/{camera_id}', response_model=CameraOut, status_code=status.HTTP_200_OK)
-def get_camera_by_id(
+async def get_camera_by_id(
         camera_id: UUID,
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    camera = db.query(Camera).filter(Camera.id == camera_id).first()
+    camera = await db.scalar(select(Camera).where(Camera.id == camera_id))
     if not camera:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Camera not found')
     return camera
 
 
 @router.post('/', response_model=CameraCreateOut, status_code=status.HTTP_201_CREATED)
-def create_camera(
+async def create_camera(
         camera_create: CameraCreate,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         current_active_user: CurrentActiveUserDependency
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
     new_camera = Camera(**camera_create.model_dump())
     db.add(new_camera)
-    db.commit()
-    db.refresh(new_camera)
+    await db.commit()
+    await db.refresh(new_camera)
+    await device_added(redis_client, 'camera', new_camera.api_key)
     return new_camera
 
 
+@router.post('/bulk', response_model=BulkCreateOut[CameraBulkItemOut], status_code=status.HTTP_201_CREATED)
+async def create_cameras(
+        cameras_create: CamerasBulkCreate,
+        db: DatabaseDependency,
+        redis_client: RedisDependency,
+        current_active_user: CurrentActiveUserDependency
+):
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    check_bulk_size(len(cameras_create.cameras))
+    items = [camera.model_dump() for camera in cameras_create.cameras]
+    parking_lot_ids = set(await db.scalars(select(ParkingLot.id).where(
+        ParkingLot.id.in_({item['parking_lot_id'] for item in items}), ParkingLot.is_active == True)))
+    existing_ids = set(await db.scalars(select(Camera.id).where(Camera.id.in_({item['id'] for item in items}))))
+    errors = []
+    pending = []
+    for index, item in enumerate(items):
+        if item['parking_lot_id'] not in parking_lot_ids:
+            errors.append({'index': index, 'detail': 'Parking lot not found'})
+        elif item['id'] in existing_ids:
+            errors.append({'index': index, 'detail': 'Camera already exists'})
+        else:
+            existing_ids.add(item['id'])
+            pending.append((index, item))
+
+    created = []
+    results = await insert_returning(db, insert(Camera).returning(
+        Camera.created_at, Camera.api_key, sort_by_parameter_order=True
+    ), [item for _, item in pending])
+    for (index, item), result in zip(pending, results):
+        if isinstance(result, RowError):
+            errors.append({'index': index, 'detail': result.detail})
+        else:
+            created.append({**item, 'index': index, 'created_at': result.created_at, 'api_key': result.api_key})
+    await db.commit()
+    await devices_added(redis_client, 'camera', [item['api_key'] for item in created])
+    return json_response(BulkCreateOut[CameraBulkItemOut], {
+        'created': created,
+        'errors': sorted(errors, key=lambda error: error['index'])
+    }, status_code=status.HTTP_201_CREATED)
+
+
 @router.delete('/{camera_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_camera(
+async def delete_camera(
         camera_id: UUID,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         current_active_user: CurrentActiveUserDependency
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    camera = db.query(Camera).filter(Camera.id == camera_id).first()
+    camera = await db.scalar(select(Camera).where(Camera.id == camera_id))
     if not camera:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Camera not found')
     camera.is_active = False
     camera.deleted_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    await device_removed(redis_client, 'camera', camera.api_key)
     return
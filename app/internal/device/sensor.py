@@ -1,15 +1,25 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Query, HTTPException, status
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import String, cast, column, insert, or_, select, update, values
+from sqlalchemy.sql.sqltypes import TIMESTAMP, UUID as SQLUUID
 
+from app.dependencies.api_key import CurrentSensorDependency
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
+from app.dependencies.redis_connection import RedisDependency
 from app.models.models import Sensor, ParkingSpace
-from app.models.schemas import SensorOut, SensorCreateOut, SensorCreate
+from app.models.schemas import BulkCreateOut, SensorBulkItemOut, SensorOut, SensorCreateOut, SensorCreate, \
+    SensorReadingsIn, SensorReadingsOut, SensorsBulkCreate
+from app.utils.bulk import RowError, check_bulk_size, insert_returning
+from app.utils.occupancy import other_state, record_state_changes
+from app.utils.device_cache import device_added, device_removed, devices_added
+from app.utils.outbox import add_outbox_events, parking_space_event
+from app.utils.pagination import CachedTotal, Page, paginate_with_total
+from app.utils.space_updates import publish_space_changes
+from app.utils.serialization import json_response
 
 router = APIRouter(
     prefix='/sensors',
@@ -18,66 +28,176 @@ router = APIRouter(
 
 
 @router.get('/', response_model=Page[SensorOut], status_code=status.HTTP_200_OK)
-def get_all_sensors(
+async def get_all_sensors(
         db: DatabaseDependency,
         current_active_user: CurrentActiveUserDependency,
+        redis_client: RedisDependency,
         show_deleted: bool = Query(default=False),
         parking_lot_id: Optional[int] = Query(default=None),
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    query = db.query(Sensor)
+    query = select(Sensor)
     if not show_deleted:
-        query = query.filter(Sensor.is_active == True)
+        query = query.where(Sensor.is_active == True)
     if parking_lot_id is not None:
-        query = query.join(Sensor.parking_space).filter(ParkingSpace.parking_lot_id == parking_lot_id)
-    results = paginate(query)
+        query = query.join(Sensor.parking_space).where(ParkingSpace.parking_lot_id == parking_lot_id)
+    results = await paginate_with_total(db, query, CachedTotal(redis_client, 'sensors', {
+        'show_deleted': show_deleted,
+        'parking_lot_id': parking_lot_id
+    }))
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(Page[SensorOut], results)
+
+
+@router.post('/readings', response_model=SensorReadingsOut, status_code=status.HTTP_200_OK)
+async def ingest_sensor_readings(
+        sensor_readings: SensorReadingsIn,
+        db: DatabaseDependency,
+        redis_client: RedisDependency,
+        current_sensor: CurrentSensorDependency
+):
+    if current_sensor.parking_lot_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Sensor is not attached to a parking space')
+    now = datetime.utcnow()
+    latest_readings = {}
+    for reading in sensor_readings.readings:
+        timestamp = reading.timestamp
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        timestamp = min(timestamp, now)
+        latest = latest_readings.get(reading.sensor_id)
+        if latest is None or latest[1] < timestamp:
+            latest_readings[reading.sensor_id] = (reading.state.value, timestamp)
+
+    # Only the newest reading per sensor is applied, and only when it is newer than the last
+    # recorded change, so a late or replayed batch never overwrites a fresher state.
+    readings = values(
+        column('sensor_id', SQLUUID(as_uuid=True)),
+        column('state', String),
+        column('timestamp', TIMESTAMP),
+        name='readings'
+    ).data([(sensor_id, state, timestamp) for sensor_id, (state, timestamp) in latest_readings.items()])
+    reading_timestamp = cast(readings.c.timestamp, TIMESTAMP)
+    statement = update(ParkingSpace) \
+        .where(Sensor.id == cast(readings.c.sensor_id, SQLUUID(as_uuid=True)),
+               ParkingSpace.id == Sensor.parking_space_id,
+               Sensor.is_active == True,
+               ParkingSpace.is_active == True,
+               ParkingSpace.parking_lot_id == current_sensor.parking_lot_id,
+               ParkingSpace.state != readings.c.state,
+               or_(ParkingSpace.updated_at == None, ParkingSpace.updated_at < reading_timestamp)) \
+        .values(state=readings.c.state, updated_at=reading_timestamp) \
+        .returning(ParkingSpace.id, ParkingSpace.parking_lot_id, ParkingSpace.vehicle_type, ParkingSpace.state,
+                   ParkingSpace.updated_at)
+    applied = (await db.execute(statement, execution_options={'synchronize_session': False})).all()
+    await add_outbox_events(db, [
+        parking_space_event('state_changed', parking_lot_id, parking_space_id, vehicle_type, state, updated_at)
+        for parking_space_id, parking_lot_id, vehicle_type, state, updated_at in applied
+    ])
+    await db.commit()
+    await record_state_changes(redis_client, [
+        (parking_lot_id, vehicle_type, other_state(state), state)
+        for _, parking_lot_id, vehicle_type, state, _ in applied
+    ])
+    await publish_space_changes(redis_client, [
+        (parking_lot_id, parking_space_id, vehicle_type, state)
+        for parking_space_id, parking_lot_id, vehicle_type, state, _ in applied
+    ])
+    return {
+        'received': len(sensor_readings.readings),
+        'applied': len(applied)
+    }
 
 
 @router.get('/{sensor_id}', response_model=SensorOut, status_code=status.HTTP_200_OK)
-def get_sensor_by_id(
+async def get_sensor_by_id(
         sensor_id: UUID,
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    sensor = db.query(Sensor).filter(Sensor.id == sensor_id).first()
+    sensor = await db.scalar(select(Sensor).where(Sensor.id == sensor_id))
     if not sensor:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Camera not found')
     return sensor
 
 
 @router.post('/', response_model=SensorCreateOut, status_code=status.HTTP_201_CREATED)
-def create_sensor(
+async def create_sensor(
         sensor_create: SensorCreate,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         current_active_user: CurrentActiveUserDependency
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
     new_sensor = Sensor(**sensor_create.model_dump())
     db.add(new_sensor)
-    db.commit()
-    db.refresh(new_sensor)
+    await db.commit()
+    await db.refresh(new_sensor)
+    await device_added(redis_client, 'sensor', new_sensor.api_key)
     return new_sensor
 
 
+@router.post('/bulk', response_model=BulkCreateOut[SensorBulkItemOut], status_code=status.HTTP_201_CREATED)
+async def create_sensors(
+        sensors_create: SensorsBulkCreate,
+        db: DatabaseDependency,
+        redis_client: RedisDependency,
+        current_active_user: CurrentActiveUserDependency
+):
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    check_bulk_size(len(sensors_create.sensors))
+    items = [sensor.model_dump() for sensor in sensors_create.sensors]
+    parking_space_ids = set(await db.scalars(select(ParkingSpace.id).where(
+        ParkingSpace.id.in_({item['parking_space_id'] for item in items}), ParkingSpace.is_active == True)))
+    existing_ids = set(await db.scalars(select(Sensor.id).where(Sensor.id.in_({item['id'] for item in items}))))
+    errors = []
+    pending = []
+    for index, item in enumerate(items):
+        if item['parking_space_id'] not in parking_space_ids:
+            errors.append({'index': index, 'detail': 'Parking space not found'})
+        elif item['id'] in existing_ids:
+            errors.append({'index': index, 'detail': 'Sensor already exists'})
+        else:
+            existing_ids.add(item['id'])
+            pending.append((index, item))
+
+    created = []
+    results = await insert_returning(db, insert(Sensor).returning(
+        Sensor.created_at, Sensor.api_key, sort_by_parameter_order=True
+    ), [item for _, item in pending])
+    for (index, item), result in zip(pending, results):
+        if isinstance(result, RowError):
+            errors.append({'index': index, 'detail': result.detail})
+        else:
+            created.append({**item, 'index': index, 'created_at': result.created_at, 'api_key': result.api_key})
+    await db.commit()
+    await devices_added(redis_client, 'sensor', [item['api_key'] for item in created])
+    return json_response(BulkCreateOut[SensorBulkItemOut], {
+        'created': created,
+        'errors': sorted(errors, key=lambda error: error['index'])
+    }, status_code=status.HTTP_201_CREATED)
+
+
 @router.delete('/{sensor_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_sensor(
+async def delete_sensor(
         sensor_id: UUID,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         current_active_user: CurrentActiveUserDependency
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    sensor = db.query(Sensor).filter(Sensor.id == sensor_id).first()
+    sensor = await db.scalar(select(Sensor).where(Sensor.id == sensor_id))
     if not sensor:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Camera not found')
     sensor.is_active = False
     sensor.deleted_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    await device_removed(redis_client, 'sensor', sensor.api_key)
     return
@@ -0,0 +1,22 @@
+from app.configs.load_env import *
+import argparse
+import asyncio
+
+from app.dependencies.db_connection import engine
+from app.utils.stats import backfill_parking_lot_stats
+
+
+async def main(parking_lot_id=None):
+    try:
+        async with engine.begin() as conn:
+            row_count = await backfill_parking_lot_stats(conn, parking_lot_id)
+        print(f'Backfilled {row_count} hourly parking lot stats rows')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recompute hourly parking lot stats from activity logs')
+    parser.add_argument('--parking-lot-id', type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.parking_lot_id))
@@ -0,0 +1,23 @@
+from app.configs.load_env import *
+import asyncio
+
+from app.dependencies.db_connection import engine
+from app.utils.partitions import archive_old_partitions, maintain_partitions, partition_default_rows
+
+
+async def main():
+    try:
+        if not await maintain_partitions(engine):
+            return
+        async with engine.begin() as conn:
+            months = await partition_default_rows(conn)
+        if months:
+            print(f'Moved {months} months of activity logs out of the default partition')
+        archived = await archive_old_partitions(engine)
+        print(f'Archived {len(archived)} activity log partitions')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
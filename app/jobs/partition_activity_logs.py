@@ -0,0 +1,79 @@
+from app.configs.load_env import *
+import argparse
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.dependencies.db_connection import engine
+from app.models.models import ActivityLog
+from app.utils.partitions import ACTIVITY_LOG_PARTITIONS_AHEAD, ACTIVITY_LOG_RETENTION_MONTHS, PARENT_TABLE, \
+    PARTITION_MAINTENANCE_LOCK_ID, create_partitions, is_partitioned, month_start
+
+OLD_TABLE = f'{PARENT_TABLE}_unpartitioned'
+COLUMNS = ', '.join(f'"{column.name}"' for column in ActivityLog.__table__.columns)
+
+
+def months_between(start: datetime, end: datetime) -> int:
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+async def main(args):
+    try:
+        # A single transaction, so a failure leaves the plain table as it was. Writes to activity_logs wait on the
+        # table lock until the copy commits.
+        async with engine.begin() as conn:
+            await conn.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'),
+                               {'lock_id': PARTITION_MAINTENANCE_LOCK_ID})
+            if await is_partitioned(conn):
+                print(f'{PARENT_TABLE} is already partitioned')
+                return
+            await conn.execute(text(f'LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE'))
+            sequence = await conn.scalar(text("SELECT pg_get_serial_sequence(:name, 'id')"), {'name': PARENT_TABLE})
+
+            # Free the table and index names for the partitioned table
+            await conn.execute(text(f'ALTER TABLE {PARENT_TABLE} RENAME TO {OLD_TABLE}'))
+            indexes = (await conn.scalars(text('SELECT indexname FROM pg_indexes '
+                                               'WHERE schemaname = current_schema() AND tablename = :name'),
+                                          {'name': OLD_TABLE})).all()
+            for index in indexes:
+                await conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_unpartitioned"'))
+            if sequence is not None:
+                await conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY NONE'))
+            await conn.run_sync(ActivityLog.__table__.create)
+
+            # Keep numbering ids from the existing sequence rather than the one created with the new table
+            new_sequence = await conn.scalar(text("SELECT pg_get_serial_sequence(:name, 'id')"), {'name': PARENT_TABLE})
+            if sequence is not None and new_sequence != sequence:
+                await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ALTER COLUMN id "
+                                        f"SET DEFAULT nextval('{sequence}'::regclass)"))
+                await conn.execute(text(f'DROP SEQUENCE {new_sequence}'))
+                await conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id'))
+
+            oldest, newest = (await conn.execute(text(f'SELECT min("timestamp"), max("timestamp") '
+                                                      f'FROM {OLD_TABLE}'))).one()
+            current_month = month_start(datetime.utcnow())
+            months_behind = max(ACTIVITY_LOG_RETENTION_MONTHS,
+                                months_between(oldest, current_month) if oldest else 0)
+            months_ahead = max(ACTIVITY_LOG_PARTITIONS_AHEAD,
+                               months_between(current_month, newest) if newest else 0)
+            await create_partitions(conn, months_ahead=months_ahead, months_behind=months_behind)
+            result = await conn.execute(text(f'INSERT INTO {PARENT_TABLE} ({COLUMNS}) '
+                                             f'SELECT {COLUMNS} FROM {OLD_TABLE}'))
+            if not args.keep_old_table:
+                await conn.execute(text(f'DROP TABLE {OLD_TABLE}'))
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+            await conn.execute(text(f'ANALYZE {PARENT_TABLE}'))
+        print(f'Copied {result.rowcount} activity logs into {months_behind + months_ahead + 1} monthly partitions'
+              + (f', the old table is kept as {OLD_TABLE}' if args.keep_old_table else ''))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a plain activity_logs table into the partitioned layout')
+    parser.add_argument('--keep-old-table', action='store_true',
+                        help=f'keep the original rows in {OLD_TABLE} instead of dropping it')
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,50 @@
+from app.configs.load_env import *
+import asyncio
+
+from sqlalchemy import select, text, update
+
+from app.dependencies.db_connection import SessionLocal, engine
+from app.models.models import Vehicle
+from app.utils.license_plates import normalize_license_plate
+
+BATCH_SIZE = 5000
+
+
+async def main():
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            await conn.execute(text('ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS normalized_license_plate VARCHAR'))
+        row_count = 0
+        last_id = 0
+        async with SessionLocal() as db:
+            # Walk the table by id in short transactions, and only write the plates whose normalised form changed
+            while True:
+                rows = (await db.execute(select(Vehicle.id, Vehicle.license_plate, Vehicle.normalized_license_plate)
+                                         .where(Vehicle.id > last_id).order_by(Vehicle.id).limit(BATCH_SIZE))).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                changes = []
+                for row in rows:
+                    normalized_license_plate = normalize_license_plate(row.license_plate or '')
+                    if normalized_license_plate != row.normalized_license_plate:
+                        changes.append({'id': row.id, 'normalized_license_plate': normalized_license_plate})
+                if changes:
+                    await db.execute(update(Vehicle), changes)
+                await db.commit()
+                row_count += len(changes)
+        # Built after the backfill, and without blocking writes to vehicles
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+            await conn.execute(text('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vehicles_normalized_license_plate '
+                                    'ON vehicles (normalized_license_plate varchar_pattern_ops)'))
+            await conn.execute(text('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vehicles_normalized_license_plate_trgm '
+                                    'ON vehicles USING gin (normalized_license_plate gin_trgm_ops)'))
+        print(f'Normalised {row_count} license plates')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+from app.configs.load_env import *
+import asyncio
+
+from app.dependencies.db_connection import SessionLocal, engine
+from app.dependencies.redis_connection import close_redis_pool, get_redis, init_redis_pool
+from app.utils.occupancy import rebuild_occupancy_index
+
+
+async def main():
+    init_redis_pool()
+    try:
+        async with SessionLocal() as db:
+            parking_lot_count = await rebuild_occupancy_index(db, get_redis())
+        print(f'Rebuilt occupancy index for {parking_lot_count} parking lots')
+    finally:
+        await close_redis_pool()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
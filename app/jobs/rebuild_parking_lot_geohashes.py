@@ -0,0 +1,29 @@
+from app.configs.load_env import *
+import asyncio
+
+from sqlalchemy import select, text
+
+from app.dependencies.db_connection import SessionLocal, engine
+from app.models.models import ParkingLot
+from app.utils.geohash import encode
+
+
+async def main():
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text('ALTER TABLE parking_lots ADD COLUMN IF NOT EXISTS geohash VARCHAR'))
+            await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_parking_lots_geohash '
+                                    'ON parking_lots (geohash varchar_pattern_ops)'))
+        async with SessionLocal() as db:
+            parking_lots = (await db.scalars(select(ParkingLot).where(ParkingLot.latitude.isnot(None),
+                                                                      ParkingLot.longitude.isnot(None)))).all()
+            for parking_lot in parking_lots:
+                parking_lot.geohash = encode(parking_lot.latitude, parking_lot.longitude)
+            await db.commit()
+        print(f'Rebuilt geohashes for {len(parking_lots)} parking lots')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
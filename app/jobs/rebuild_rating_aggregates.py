@@ -0,0 +1,30 @@
+from app.configs.load_env import *
+import asyncio
+
+from sqlalchemy import text
+
+from app.dependencies.db_connection import engine
+from app.dependencies.redis_connection import close_redis_pool, get_redis
+from app.utils.ratings import rebuild_rating_aggregates
+from app.utils.response_cache import PARKING_LOTS_TAG, invalidate_tag_prefix
+
+
+async def main():
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text('ALTER TABLE parking_lots '
+                                    'ADD COLUMN IF NOT EXISTS rating_count INTEGER NOT NULL DEFAULT 0, '
+                                    'ADD COLUMN IF NOT EXISTS rating_sum INTEGER NOT NULL DEFAULT 0, '
+                                    'ADD COLUMN IF NOT EXISTS rating_average FLOAT NOT NULL DEFAULT 0'))
+            await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_parking_lots_rating_average_id '
+                                    'ON parking_lots (rating_average, id)'))
+            row_count = await rebuild_rating_aggregates(conn)
+        await invalidate_tag_prefix(get_redis(), PARKING_LOTS_TAG)
+        print(f'Rebuilt rating aggregates for {row_count} parking lots')
+    finally:
+        await close_redis_pool()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,13 +1,62 @@
 from .configs.load_env import *
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .configs.allowed_origins import allowed_origins
-from .routes import user, auth, parking_lot, vehicle, activity_log, rating_feedback, parking_space
+from .routes import user, auth, parking_lot, vehicle, activity_log, rating_feedback, parking_space, \
+    parking_space_updates
 from fastapi_pagination import add_pagination
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.internal.admin import admin
 from app.internal.device import devices
+from .dependencies.db_connection import SessionLocal, create_tables, engine
+from .dependencies.redis_connection import init_redis_pool, close_redis_pool, get_redis
+from .utils.alerts import alert_hub
+from .utils.device_cache import listen_for_device_changes
+from .utils.metrics import MetricsMiddleware
+from .utils.occupancy import fill_missing_occupancy
+from .utils.outbox import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL_SECONDS, OUTBOX_SINK, create_sink, \
+    purge_dispatched_events, run_outbox_dispatcher
+from .utils.partitions import maintain_partitions
+from .utils.password import password_hasher
+from .utils.space_updates import space_update_hub
+from .utils.sql_profiler import SQL_PROFILING_ENABLED, install_sql_profiler
+from .utils.tasks import run_periodically
+from .utils.token_cache import listen_for_invalidations
+from .utils.watchlist import listen_for_watchlist_changes
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_tables()
+    await maintain_partitions(engine)
+    init_redis_pool()
+    async with SessionLocal() as db:
+        await fill_missing_occupancy(db, get_redis())
+    background_tasks = [
+        asyncio.create_task(listen_for_invalidations(get_redis())),
+        asyncio.create_task(listen_for_device_changes(get_redis(), SessionLocal)),
+        asyncio.create_task(listen_for_watchlist_changes(get_redis(), SessionLocal)),
+        alert_hub.start(get_redis()),
+        asyncio.create_task(run_periodically(24 * 60 * 60, maintain_partitions, engine)),
+        space_update_hub.start(get_redis()),
+        asyncio.create_task(run_outbox_dispatcher(engine, get_redis(), create_sink(OUTBOX_SINK), OUTBOX_BATCH_SIZE,
+                                                  OUTBOX_POLL_INTERVAL_SECONDS)),
+        asyncio.create_task(run_periodically(60 * 60, purge_dispatched_events, engine)),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    password_hasher.shutdown()
+    await close_redis_pool()
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +65,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if SQL_PROFILING_ENABLED:
+    install_sql_profiler(app, engine)
 
 app.include_router(auth.router)
 app.include_router(user.router)
@@ -24,6 +76,7 @@ app.include_router(vehicle.router)
 app.include_router(activity_log.router)
 app.include_router(rating_feedback.router)
 app.include_router(parking_space.router)
+app.include_router(parking_space_updates.router)
 app.include_router(admin.router)
 app.include_router(devices.router)
 
@@ -31,5 +84,10 @@ add_pagination(app)
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Hello World"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -0,0 +1,24 @@
+from sqlalchemy.orm import joinedload
+
+from .models import ActivityLog, ParkingSpace, RatingFeedback, Vehicle
+
+# Loader options matching the nested fields of each response schema. Every nested relationship is
+# many-to-one, so it is joined into the page query instead of being loaded with one query per row.
+activity_log_out_options = (
+    joinedload(ActivityLog.parking_lot, innerjoin=True),
+    joinedload(ActivityLog.vehicle, innerjoin=True),
+)
+activity_log_admin_out_options = (
+    joinedload(ActivityLog.parking_lot, innerjoin=True),
+    joinedload(ActivityLog.vehicle, innerjoin=True).joinedload(Vehicle.owner),
+)
+rating_feedback_out_options = (
+    joinedload(RatingFeedback.user),
+    joinedload(RatingFeedback.parking_lot),
+)
+parking_space_out_options = (
+    joinedload(ParkingSpace.vehicle),
+)
+vehicle_admin_out_options = (
+    joinedload(Vehicle.owner),
+)
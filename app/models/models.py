@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey
+from sqlalchemy import Column, BigInteger, Integer, String, Boolean, Float, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP, UUID
 from sqlalchemy.orm import relationship
@@ -17,23 +18,31 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     deleted_at = Column(TIMESTAMP, server_default=text("NULL"))
 
-    vehicles = relationship("Vehicle", back_populates="owner")
+    vehicles = relationship("Vehicle", back_populates="owner", lazy="raise_on_sql")
 
 
 class ParkingLot(Base):
     __tablename__ = "parking_lots"
+    __table_args__ = (
+        Index("ix_parking_lots_geohash", "geohash", postgresql_ops={"geohash": "varchar_pattern_ops"}),
+        Index("ix_parking_lots_rating_average_id", "rating_average", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     name = Column(String, unique=True, index=True)
     longitude = Column(Float)
     latitude = Column(Float)
+    geohash = Column(String)
+    rating_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    rating_sum = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    rating_average = Column(Float, nullable=False, default=0, server_default=text("0"))
     created_at = Column(TIMESTAMP, server_default=text("now()"))
     updated_at = Column(TIMESTAMP, server_default=text("NULL"))
     is_active = Column(Boolean, default=True)
     deleted_at = Column(TIMESTAMP, server_default=text("NULL"))
 
-    ratings_feedbacks = relationship("RatingFeedback", back_populates="parking_lot")
-    parking_spaces = relationship("ParkingSpace", back_populates="parking_lot")
+    ratings_feedbacks = relationship("RatingFeedback", back_populates="parking_lot", lazy="raise_on_sql")
+    parking_spaces = relationship("ParkingSpace", back_populates="parking_lot", lazy="raise_on_sql")
 
 
 class Camera(Base):
@@ -47,7 +56,7 @@ class Camera(Base):
     is_active = Column(Boolean, default=True)
     deleted_at = Column(TIMESTAMP, server_default=text("NULL"))
 
-    parking_lot = relationship("ParkingLot")
+    parking_lot = relationship("ParkingLot", lazy="raise_on_sql")
 
 
 class Sensor(Base):
@@ -61,7 +70,7 @@ class Sensor(Base):
     is_active = Column(Boolean, default=True)
     deleted_at = Column(TIMESTAMP, server_default=text("NULL"))
 
-    parking_space = relationship("ParkingSpace", back_populates="sensor")
+    parking_space = relationship("ParkingSpace", back_populates="sensor", lazy="raise_on_sql")
 
 
 class ParkingSpace(Base):
@@ -79,23 +88,30 @@ class ParkingSpace(Base):
     vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=True, unique=True)
     parking_lot_id = Column(Integer, ForeignKey("parking_lots.id", ondelete="CASCADE"))
 
-    sensor = relationship("Sensor", uselist=False, back_populates="parking_space")
-    vehicle = relationship("Vehicle")
-    parking_lot = relationship("ParkingLot", back_populates="parking_spaces")
+    sensor = relationship("Sensor", uselist=False, back_populates="parking_space", lazy="raise_on_sql")
+    vehicle = relationship("Vehicle", lazy="raise_on_sql")
+    parking_lot = relationship("ParkingLot", back_populates="parking_spaces", lazy="raise_on_sql")
 
 
 class Vehicle(Base):
     __tablename__ = "vehicles"
+    __table_args__ = (
+        Index("ix_vehicles_normalized_license_plate", "normalized_license_plate",
+              postgresql_ops={"normalized_license_plate": "varchar_pattern_ops"}),
+        Index("ix_vehicles_normalized_license_plate_trgm", "normalized_license_plate", postgresql_using="gin",
+              postgresql_ops={"normalized_license_plate": "gin_trgm_ops"}),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     license_plate = Column(String, unique=True, index=True)
+    normalized_license_plate = Column(String)
     vehicle_type = Column(String, nullable=False)
     is_tracked = Column(Boolean, default=False)
     updated_at = Column(TIMESTAMP, server_default=text("NULL"))
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     created_at = Column(TIMESTAMP, server_default=text("now()"))
 
-    owner = relationship("User", back_populates="vehicles")
+    owner = relationship("User", back_populates="vehicles", lazy="raise_on_sql")
 
 
 class RatingFeedback(Base):
@@ -111,8 +127,8 @@ class RatingFeedback(Base):
     is_active = Column(Boolean, default=True)
     deleted_at = Column(TIMESTAMP, server_default=text("NULL"))
 
-    user = relationship("User")
-    parking_lot = relationship("ParkingLot")
+    user = relationship("User", lazy="raise_on_sql")
+    parking_lot = relationship("ParkingLot", lazy="raise_on_sql")
 
 
 class ActivityLog(Base):
@@ -121,8 +137,59 @@ class ActivityLog(Base):
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     activity_type = Column(String, nullable=False)
     vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=False)
-    timestamp = Column(TIMESTAMP, nullable=False)
+    timestamp = Column(TIMESTAMP, primary_key=True, nullable=False)
     parking_lot_id = Column(Integer, ForeignKey("parking_lots.id", ondelete="CASCADE"), nullable=False)
 
-    vehicle = relationship("Vehicle")
-    parking_lot = relationship("ParkingLot")
+    vehicle = relationship("Vehicle", lazy="raise_on_sql")
+    parking_lot = relationship("ParkingLot", lazy="raise_on_sql")
+
+    __table_args__ = (
+        Index("ix_activity_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_activity_logs_parking_lot_id_timestamp_id", "parking_lot_id", "timestamp", "id"),
+        Index("ix_activity_logs_vehicle_id_timestamp_id", "vehicle_id", "timestamp", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+class Alert(Base):
+    __tablename__ = "alerts"
+    __table_args__ = (
+        Index("ix_alerts_vehicle_id_id", "vehicle_id", "id"),
+        Index("ix_alerts_parking_lot_id_id", "parking_lot_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    alert_type = Column(String, nullable=False)
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=False)
+    license_plate = Column(String, nullable=False)
+    parking_lot_id = Column(Integer, ForeignKey("parking_lots.id", ondelete="CASCADE"), nullable=False)
+    activity_type = Column(String, nullable=False)
+    timestamp = Column(TIMESTAMP, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=text("now()"))
+
+
+class ParkingLotHourlyStats(Base):
+    __tablename__ = "parking_lot_hourly_stats"
+
+    parking_lot_id = Column(Integer, ForeignKey("parking_lots.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(TIMESTAMP, primary_key=True)
+    entries = Column(Integer, nullable=False, server_default=text("0"))
+    exits = Column(Integer, nullable=False, server_default=text("0"))
+    peak_occupancy = Column(Integer, nullable=False, server_default=text("0"))
+    closing_occupancy = Column(Integer, nullable=False, server_default=text("0"))
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)
+    key = Column(String, nullable=True)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=text("now()"))
+    dispatched_at = Column(TIMESTAMP, server_default=text("NULL"))
+
+    __table_args__ = (
+        Index("ix_outbox_events_pending_id", "id", postgresql_where=text("dispatched_at IS NULL")),
+        Index("ix_outbox_events_dispatched_at", "dispatched_at", postgresql_where=text("dispatched_at IS NOT NULL")),
+    )
@@ -3,7 +3,9 @@ from uuid import uuid4, UUID
 
 from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
-from typing import Optional
+from typing import Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
 
 
 # User
@@ -67,6 +69,8 @@ class ParkingLotCreateOut(ParkingLotBase):
 
 class ParkingLotOut(ParkingLotBase):
     id: int
+    rating_count: int = 0
+    rating_average: float = 0
 
 
 class ParkingLotUpdate(BaseModel):
@@ -82,6 +86,28 @@ class ParkingLotAdminOut(ParkingLotOut):
     deleted_at: Optional[datetime] = None
 
 
+class VehicleTypeAvailability(BaseModel):
+    vehicle_type: str
+    free: int
+    occupied: int
+
+
+class ParkingLotNearbyOut(ParkingLotOut):
+    distance: float
+
+
+class ParkingLotAvailabilityOut(BaseModel):
+    parking_lot_id: int
+    availability: List[VehicleTypeAvailability]
+
+
+class ParkingLotStatsOut(BaseModel):
+    period: datetime
+    entries: int
+    exits: int
+    peak_occupancy: int
+
+
 # Vehicle
 class VehicleType(str, Enum):
     car = 'car'
@@ -124,7 +150,16 @@ class VehicleAdminOut(VehicleOut):
     owner: Owner
 
 
+class VehicleSearchOut(VehicleAdminOut):
+    distance: int
+
+
 # ActivityLog
+class ActivityType(str, Enum):
+    entry = 'entry'
+    exit = 'exit'
+
+
 class User(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -159,6 +194,24 @@ class ActivityLogAdminOut(BaseModel):
     vehicle: VehicleAdminOut
 
 
+# Alert
+class AlertType(str, Enum):
+    tracked_vehicle = 'tracked_vehicle'
+
+
+class AlertOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    alert_type: str
+    vehicle_id: int
+    license_plate: str
+    parking_lot_id: int
+    activity_type: str
+    timestamp: datetime
+    created_at: datetime
+
+
 # Rating Feedback
 class BaseRatingFeedback(BaseModel):
     rating: int
@@ -198,6 +251,11 @@ class RatingFeedbackAdminOut(RatingFeedbackOut):
     deleted_at: Optional[datetime] = None
 
 
+class ParkingSpaceState(str, Enum):
+    free = 'free'
+    occupied = 'occupied'
+
+
 class ParkingSpaceBase(BaseModel):
     longitude: int
     latitude: int
@@ -223,6 +281,23 @@ class ParkingSpaceOut(ParkingSpaceBase):
     vehicle: Optional[VehicleOut] = None
 
 
+class ParkingSpaceGrid(BaseModel):
+    parking_lot_id: int
+    vehicle_type: VehicleType
+    rows: int = Field(ge=1)
+    columns: int = Field(ge=1)
+    origin_longitude: int = 0
+    origin_latitude: int = 0
+    row_spacing: int = 1
+    column_spacing: int = 1
+
+
+class ParkingSpacesBulkCreate(BaseModel):
+    parking_spaces: List[ParkingSpaceCreate] = []
+    grids: List[ParkingSpaceGrid] = []
+    with_sensors: bool = False
+
+
 class ParkingSpaceAdminOut(ParkingSpaceOut):
     is_active: bool
     created_at: datetime
@@ -246,12 +321,32 @@ class CameraCreateOut(CameraBase):
     api_key: str
 
 
+class CamerasBulkCreate(BaseModel):
+    cameras: List[CameraCreate] = Field(min_length=1)
+
+
 class CameraOut(CameraBase):
     created_at: datetime
     is_active: bool
     created_at: Optional[datetime] = None
 
 
+class PlateRead(BaseModel):
+    license_plate: str
+    activity_type: ActivityType
+    timestamp: datetime
+
+
+class PlateReadsIn(BaseModel):
+    reads: List[PlateRead] = Field(min_length=1, max_length=5000)
+
+
+class PlateReadsOut(BaseModel):
+    received: int
+    inserted: int
+    unmatched_license_plates: List[str]
+
+
 # Sensor
 class SensorBase(BaseModel):
     id: UUID = Field(default_factory=uuid4)
@@ -267,7 +362,50 @@ class SensorCreateOut(SensorBase):
     api_key: str
 
 
+class SensorsBulkCreate(BaseModel):
+    sensors: List[SensorCreate] = Field(min_length=1)
+
+
 class SensorOut(SensorBase):
     created_at: datetime
     is_active: bool
     deleted_at: Optional[datetime] = None
+
+
+class SensorReading(BaseModel):
+    sensor_id: UUID
+    state: ParkingSpaceState
+    timestamp: datetime
+
+
+class SensorReadingsIn(BaseModel):
+    readings: List[SensorReading] = Field(min_length=1, max_length=5000)
+
+
+class SensorReadingsOut(BaseModel):
+    received: int
+    applied: int
+
+
+# Bulk
+class BulkItemError(BaseModel):
+    index: int
+    detail: str
+
+
+class BulkCreateOut(BaseModel, Generic[T]):
+    created: List[T]
+    errors: List[BulkItemError]
+
+
+class SensorBulkItemOut(SensorCreateOut):
+    index: int
+
+
+class CameraBulkItemOut(CameraCreateOut):
+    index: int
+
+
+class ParkingSpaceBulkItemOut(ParkingSpaceCreateOut):
+    index: int
+    sensor: Optional[SensorCreateOut] = None
@@ -1,15 +1,22 @@
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, Request, status, Query
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import func, literal_column, or_, select
 
-from ..models.schemas import ParkingLotCreate, ParkingLotUpdate, ParkingLotCreateOut, ParkingLotOut
+from ..models.schemas import ParkingLotCreate, ParkingLotUpdate, ParkingLotCreateOut, ParkingLotOut, \
+    ParkingLotAvailabilityOut, ParkingLotNearbyOut
 from ..models.models import ParkingLot
 from ..dependencies.db_connection import DatabaseDependency
 from ..dependencies.oauth2 import CurrentActiveUserDependency
+from ..dependencies.redis_connection import RedisDependency
+from ..utils.occupancy import get_availability
+from ..utils.pagination import CachedTotal, Page, paginate_with_total
+from ..utils.geohash import EARTH_RADIUS_METERS, METERS_PER_DEGREE, covering_prefixes, encode
+from ..utils.response_cache import PARKING_LOTS_TAG, ResponseCache, invalidate_tags, parking_lot_tag, \
+    parking_lot_tags
+from ..utils.serialization import serialize
 
 router = APIRouter(
     prefix='/parking-lots',
@@ -18,87 +25,173 @@ router = APIRouter(
 
 
 @router.get('/', response_model=Page[ParkingLotOut], status_code=status.HTTP_200_OK)
-def get_all_parking_lots(
+async def get_all_parking_lots(
+        request: Request,
         db: DatabaseDependency,
         current_active_user: CurrentActiveUserDependency,
+        redis_client: RedisDependency,
         show_deleted: bool = Query(default=False),
         name: Optional[str] = Query(default=None),
+        sort: str = Query(default='asc', regex='^(desc|asc)$'),
+        order: str = Query(default='id', regex='^(id|rating)$'),
 ):
-    query = db.query(ParkingLot)
+    cache = ResponseCache(redis_client, 'parking_lots', {
+        'show_deleted': current_active_user.is_superuser and show_deleted,
+        'query': sorted(request.query_params.multi_items())
+    }, [PARKING_LOTS_TAG])
+    cached_response = await cache.lookup(request)
+    if cached_response is not None:
+        return cached_response
+    query = select(ParkingLot)
     if not current_active_user.is_superuser or not show_deleted:
-        query = query.filter(ParkingLot.is_active == True)
+        query = query.where(ParkingLot.is_active == True)
     if name is not None:
-        query = query.filter(ParkingLot.name.ilike(f'{name.lower()}%'))
-    results = paginate(query)
+        query = query.where(ParkingLot.name.ilike(f'{name.lower()}%'))
+    sort_conditions = [ParkingLot.rating_average, ParkingLot.id] if order == 'rating' else [ParkingLot.id]
+    query = query.order_by(*[condition.desc() if sort == 'desc' else condition.asc() for condition in sort_conditions])
+    results = await paginate_with_total(db, query, CachedTotal(redis_client, 'parking_lots', {
+        'show_deleted': current_active_user.is_superuser and show_deleted,
+        'name': name.lower() if name is not None else None
+    }))
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    return await cache.store(serialize(Page[ParkingLotOut], results),
+                             max(parking_lot.updated_at or parking_lot.created_at for parking_lot in results.items))
+
+
+@router.get('/nearby', response_model=List[ParkingLotNearbyOut], status_code=status.HTTP_200_OK)
+async def get_nearby_parking_lots(
+        db: DatabaseDependency,
+        current_active_user: CurrentActiveUserDependency,
+        lat: float = Query(ge=-90, le=90),
+        lon: float = Query(ge=-180, le=180),
+        radius: float = Query(default=1000, gt=0, le=50000),
+        limit: int = Query(default=20, ge=1, le=100),
+):
+    distance = (2 * EARTH_RADIUS_METERS * func.asin(func.sqrt(
+        func.power(func.sin(func.radians(ParkingLot.latitude - lat) / 2), 2) +
+        func.cos(func.radians(lat)) * func.cos(func.radians(ParkingLot.latitude)) *
+        func.power(func.sin(func.radians(ParkingLot.longitude - lon) / 2), 2)
+    ))).label('distance')
+    radius_degrees = radius / METERS_PER_DEGREE
+    query = select(ParkingLot, distance).where(ParkingLot.is_active == True,
+                                               ParkingLot.latitude.between(lat - radius_degrees, lat + radius_degrees))
+    prefixes = covering_prefixes(lat, lon, radius)
+    if prefixes is not None:
+        # prefixes only contain base32 characters and are inlined so that the planner can use the pattern index
+        query = query.where(or_(*[ParkingLot.geohash.like(literal_column(f"'{prefix}%'")) for prefix in prefixes]))
+    rows = await db.execute(query.where(distance <= radius).order_by(distance).limit(limit))
+    results = [{
+        'id': parking_lot.id,
+        'name': parking_lot.name,
+        'longitude': parking_lot.longitude,
+        'latitude': parking_lot.latitude,
+        'rating_count': parking_lot.rating_count,
+        'rating_average': parking_lot.rating_average,
+        'distance': parking_lot_distance
+    } for parking_lot, parking_lot_distance in rows]
+    if not results:
+        raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
     return results
 
 
 @router.post('/', response_model=ParkingLotCreateOut, status_code=status.HTTP_201_CREATED)
-def create_parking_lot(
+async def create_parking_lot(
         current_active_user: CurrentActiveUserDependency,
         parking_lot: ParkingLotCreate,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
 ):
     try:
         if not current_active_user.is_superuser:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not allowed')
-        new_parking_lot = ParkingLot(**parking_lot.model_dump())
+        new_parking_lot = ParkingLot(**parking_lot.model_dump(),
+                                     geohash=encode(parking_lot.latitude, parking_lot.longitude))
         db.add(new_parking_lot)
-        db.commit()
-        db.refresh(new_parking_lot)
+        await db.commit()
+        await db.refresh(new_parking_lot)
+        await invalidate_tags(redis_client, parking_lot_tags(new_parking_lot.id))
         return new_parking_lot
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Parking lot already exists')
 
 
 @router.get('/{parking_lot_id}', response_model=ParkingLotOut, status_code=status.HTTP_200_OK)
-def get_parking_lot_by_id(
+async def get_parking_lot_by_id(
+        request: Request,
         parking_lot_id: int,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         current_active_user: CurrentActiveUserDependency
 ):
-    parking_lot = db.query(ParkingLot).filter(ParkingLot.id == parking_lot_id).first()
+    # Only active lots are cached, since those are visible to every user. Deleting a lot bumps its tag, so a
+    # cached or revalidated copy is never served once it is inactive.
+    cache = ResponseCache(redis_client, 'parking_lot', {'id': parking_lot_id}, [parking_lot_tag(parking_lot_id)])
+    cached_response = await cache.lookup(request)
+    if cached_response is not None:
+        return cached_response
+    parking_lot = await db.scalar(select(ParkingLot).where(ParkingLot.id == parking_lot_id))
     if not parking_lot:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parking lot not found')
-    if not (parking_lot.is_active or current_active_user.is_superuser):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not allowed')
-    return parking_lot
+    if not parking_lot.is_active:
+        if not current_active_user.is_superuser:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not allowed')
+        return parking_lot
+    return await cache.store(serialize(ParkingLotOut, parking_lot), parking_lot.updated_at or parking_lot.created_at)
+
+
+@router.get('/{parking_lot_id}/availability', response_model=ParkingLotAvailabilityOut, status_code=status.HTTP_200_OK)
+async def get_parking_lot_availability(
+        parking_lot_id: int,
+        redis_client: RedisDependency,
+        current_active_user: CurrentActiveUserDependency
+):
+    return {
+        'parking_lot_id': parking_lot_id,
+        'availability': await get_availability(redis_client, parking_lot_id)
+    }
 
 
 @router.put('/{parking_lot_id}', response_model=ParkingLotOut, status_code=status.HTTP_200_OK)
-def update_parking_lot(
+async def update_parking_lot(
         parking_lot_id: int,
         parking_lot_update: ParkingLotUpdate,
         current_active_user: CurrentActiveUserDependency,
-        db: DatabaseDependency
+        db: DatabaseDependency,
+        redis_client: RedisDependency
 ):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not allowed')
-    parking_lot = db.query(ParkingLot).filter(ParkingLot.id == parking_lot_id, ParkingLot.is_active == True).first()
+    parking_lot = await db.scalar(select(ParkingLot).where(ParkingLot.id == parking_lot_id,
+                                                           ParkingLot.is_active == True))
     if not parking_lot:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parking lot not found')
     try:
         parking_lot_update_dict = parking_lot_update.model_dump(exclude_unset=True)
         for key, value in parking_lot_update_dict.items():
             setattr(parking_lot, key, value)
+        if 'longitude' in parking_lot_update_dict or 'latitude' in parking_lot_update_dict:
+            parking_lot.geohash = encode(parking_lot.latitude, parking_lot.longitude)
         parking_lot.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(parking_lot)
-        return parking_lot
+        await db.commit()
+        await db.refresh(parking_lot)
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Name already exists')
+    await invalidate_tags(redis_client, parking_lot_tags(parking_lot_id))
+    return parking_lot
 
 
 @router.delete('/{parking_lot_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_parking_lot(parking_lot_id: int, current_active_user: CurrentActiveUserDependency, db: DatabaseDependency):
+async def delete_parking_lot(parking_lot_id: int, current_active_user: CurrentActiveUserDependency,
+                             db: DatabaseDependency, redis_client: RedisDependency):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not allowed')
-    parking_lot = db.query(ParkingLot).filter(ParkingLot.id == parking_lot_id, ParkingLot.is_active == True).first()
+    parking_lot = await db.scalar(select(ParkingLot).where(ParkingLot.id == parking_lot_id,
+                                                           ParkingLot.is_active == True))
     if not parking_lot:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parking lot not found')
     parking_lot.is_active = False
     parking_lot.deleted_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    await invalidate_tags(redis_client, parking_lot_tags(parking_lot_id))
     return
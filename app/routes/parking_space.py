@@ -1,15 +1,25 @@
 from datetime import datetime
 from typing import Optional
+from uuid import uuid4
 
 from fastapi import APIRouter, status, Query, HTTPException
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import insert, select
 from sqlalchemy.exc import IntegrityError
 
 from app.dependencies.db_connection import DatabaseDependency
 from app.dependencies.oauth2 import CurrentActiveUserDependency
-from app.models.models import ParkingSpace
-from app.models.schemas import ParkingSpaceCreate, ParkingSpaceCreateOut, ParkingSpaceOut
+from app.dependencies.redis_connection import RedisDependency
+from app.models.models import ParkingLot, ParkingSpace, Sensor
+from app.models.loaders import parking_space_out_options
+from app.models.schemas import BulkCreateOut, ParkingSpaceBulkItemOut, ParkingSpaceCreate, ParkingSpaceCreateOut, \
+    ParkingSpaceGrid, ParkingSpaceOut, ParkingSpacesBulkCreate
+from app.utils.bulk import RowError, check_bulk_size, insert_returning
+from app.utils.device_cache import devices_added
+from app.utils.occupancy import record_state_changes
+from app.utils.outbox import add_outbox_events, parking_space_event
+from app.utils.pagination import CachedTotal, Page, paginate_with_total
+from app.utils.serialization import json_response
+from app.utils.space_updates import publish_space_changes
 
 router = APIRouter(
     prefix='/parking_spaces',
@@ -18,36 +28,44 @@ router = APIRouter(
 
 
 @router.get('/', response_model=Page[ParkingSpaceOut], status_code=status.HTTP_200_OK)
-def get_parking_spaces(
+async def get_parking_spaces(
         db: DatabaseDependency,
         current_active_user: CurrentActiveUserDependency,
+        redis_client: RedisDependency,
         show_deleted: bool = Query(default=False),
         parking_lot_id: Optional[int] = Query(default=None),
         vehicle_type: Optional[str] = Query(default=None, regex='^(car|motorbike|truck)$'),
         show_free_only: bool = Query(default=False)
 ):
-    query = db.query(ParkingSpace)
+    query = select(ParkingSpace).options(*parking_space_out_options)
     if not current_active_user.is_superuser or not show_deleted:
-        query = query.filter(ParkingSpace.is_active == True)
+        query = query.where(ParkingSpace.is_active == True)
     if parking_lot_id is not None:
-        query = query.filter(ParkingSpace.parking_lot_id == parking_lot_id)
+        query = query.where(ParkingSpace.parking_lot_id == parking_lot_id)
     if vehicle_type is not None:
-        query = query.filter(ParkingSpace.vehicle_type == vehicle_type)
+        query = query.where(ParkingSpace.vehicle_type == vehicle_type)
     if show_free_only:
-        query = query.filter(ParkingSpace.state == 'free')
-    results = paginate(query)
+        query = query.where(ParkingSpace.state == 'free')
+    results = await paginate_with_total(db, query, CachedTotal(redis_client, 'parking_spaces', {
+        'show_deleted': current_active_user.is_superuser and show_deleted,
+        'parking_lot_id': parking_lot_id,
+        'vehicle_type': vehicle_type,
+        'show_free_only': show_free_only
+    }))
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(Page[ParkingSpaceOut], results)
 
 
 @router.get('/{parking_space_id}', response_model=ParkingSpaceOut, status_code=status.HTTP_200_OK)
-def get_parking_space_by_id(
+async def get_parking_space_by_id(
         parking_space_id: int,
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
 ):
-    parking_space = db.query(ParkingSpace).filter(ParkingSpace.id == parking_space_id).first()
+    parking_space = await db.scalar(select(ParkingSpace)
+                                    .options(*parking_space_out_options)
+                                    .where(ParkingSpace.id == parking_space_id))
     if not parking_space:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parking space not found')
     if not (parking_space.is_active or current_active_user.is_superuser):
@@ -56,9 +74,10 @@ def get_parking_space_by_id(
 
 
 @router.post('/', response_model=ParkingSpaceCreateOut, status_code=status.HTTP_201_CREATED)
-def create_parking_space(
+async def create_parking_space(
         parking_space_create: ParkingSpaceCreate,
         db: DatabaseDependency,
+        redis_client: RedisDependency,
         current_active_user: CurrentActiveUserDependency
 ):
     if not current_active_user.is_superuser:
@@ -66,23 +85,115 @@ def create_parking_space(
     parking_space = ParkingSpace(**parking_space_create.model_dump())
     try:
         db.add(parking_space)
-        db.commit()
-        db.refresh(parking_space)
+        await db.flush()
+        await db.refresh(parking_space)
+        await add_outbox_events(db, [parking_space_event('created', parking_space.parking_lot_id, parking_space.id,
+                                                         parking_space.vehicle_type, parking_space.state,
+                                                         parking_space.created_at)])
+        await db.commit()
+        await record_state_changes(redis_client, [
+            (parking_space.parking_lot_id, parking_space.vehicle_type, None, parking_space.state)
+        ])
+        await publish_space_changes(redis_client, [
+            (parking_space.parking_lot_id, parking_space.id, parking_space.vehicle_type, parking_space.state)
+        ])
         return parking_space
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Something went wrong')
 
 
+def layout_grid(grid: ParkingSpaceGrid):
+    for row in range(grid.rows):
+        for column in range(grid.columns):
+            yield {
+                'longitude': grid.origin_longitude + column * grid.column_spacing,
+                'latitude': grid.origin_latitude + row * grid.row_spacing,
+                'parking_lot_id': grid.parking_lot_id,
+                'vehicle_type': grid.vehicle_type.value
+            }
+
+
+@router.post('/bulk', response_model=BulkCreateOut[ParkingSpaceBulkItemOut], status_code=status.HTTP_201_CREATED)
+async def create_parking_spaces(
+        parking_spaces_create: ParkingSpacesBulkCreate,
+        db: DatabaseDependency,
+        redis_client: RedisDependency,
+        current_active_user: CurrentActiveUserDependency
+):
+    # Items are numbered in the order given, the listed parking spaces first and then each grid row by row. An item
+    # that cannot be created is reported in errors and does not stop the others.
+    if not current_active_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
+    check_bulk_size(len(parking_spaces_create.parking_spaces)
+                    + sum(grid.rows * grid.columns for grid in parking_spaces_create.grids))
+    items = [parking_space.model_dump(mode='json') for parking_space in parking_spaces_create.parking_spaces]
+    for grid in parking_spaces_create.grids:
+        items.extend(layout_grid(grid))
+    parking_lot_ids = set(await db.scalars(select(ParkingLot.id).where(
+        ParkingLot.id.in_({item['parking_lot_id'] for item in items}), ParkingLot.is_active == True)))
+    errors = []
+    pending = []
+    for index, item in enumerate(items):
+        if item['parking_lot_id'] in parking_lot_ids:
+            pending.append((index, item))
+        else:
+            errors.append({'index': index, 'detail': 'Parking lot not found'})
+
+    created = []
+    results = await insert_returning(db, insert(ParkingSpace).returning(
+        ParkingSpace.id, ParkingSpace.created_at, ParkingSpace.state, sort_by_parameter_order=True
+    ), [item for _, item in pending])
+    for (index, item), result in zip(pending, results):
+        if isinstance(result, RowError):
+            errors.append({'index': index, 'detail': result.detail})
+        else:
+            created.append({**item, 'index': index, 'id': result.id, 'created_at': result.created_at,
+                            'state': result.state, 'sensor': None})
+    if parking_spaces_create.with_sensors and created:
+        results = await insert_returning(db, insert(Sensor).returning(
+            Sensor.id, Sensor.parking_space_id, Sensor.created_at, Sensor.api_key, sort_by_parameter_order=True
+        ), [{'id': uuid4(), 'parking_space_id': item['id']} for item in created])
+        for item, result in zip(created, results):
+            if isinstance(result, RowError):
+                errors.append({'index': item['index'], 'detail': f'Sensor not created: {result.detail}'})
+            else:
+                item['sensor'] = result._asdict()
+    await add_outbox_events(db, [parking_space_event('created', item['parking_lot_id'], item['id'],
+                                                     item['vehicle_type'], item['state'], item['created_at'])
+                                 for item in created])
+    await db.commit()
+
+    await record_state_changes(redis_client, [
+        (item['parking_lot_id'], item['vehicle_type'], None, item['state']) for item in created
+    ])
+    await publish_space_changes(redis_client, [
+        (item['parking_lot_id'], item['id'], item['vehicle_type'], item['state']) for item in created
+    ])
+    await devices_added(redis_client, 'sensor', [item['sensor']['api_key'] for item in created if item['sensor']])
+    return json_response(BulkCreateOut[ParkingSpaceBulkItemOut], {
+        'created': created,
+        'errors': sorted(errors, key=lambda error: error['index'])
+    }, status_code=status.HTTP_201_CREATED)
+
+
 @router.delete('/{parking_space_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_parking_space(parking_space_id: int, db: DatabaseDependency,
-                         current_active_user: CurrentActiveUserDependency):
+async def delete_parking_space(parking_space_id: int, db: DatabaseDependency, redis_client: RedisDependency,
+                               current_active_user: CurrentActiveUserDependency):
     if not current_active_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User does not have admin privileges')
-    parking_space = db.query(ParkingSpace).filter(ParkingSpace.id == parking_space_id,
-                                                  ParkingSpace.is_active == True).first()
+    parking_space = await db.scalar(select(ParkingSpace).where(ParkingSpace.id == parking_space_id,
+                                                               ParkingSpace.is_active == True))
     if not parking_space:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parking space not found')
     parking_space.is_active = False
     parking_space.deleted_at = datetime.utcnow()
-    db.commit()
+    await add_outbox_events(db, [parking_space_event('deleted', parking_space.parking_lot_id, parking_space.id,
+                                                     parking_space.vehicle_type, None, parking_space.deleted_at)])
+    await db.commit()
+    await record_state_changes(redis_client, [
+        (parking_space.parking_lot_id, parking_space.vehicle_type, parking_space.state, None)
+    ])
+    await publish_space_changes(redis_client, [
+        (parking_space.parking_lot_id, parking_space.id, parking_space.vehicle_type, None)
+    ])
     return
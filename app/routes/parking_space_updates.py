@@ -0,0 +1,70 @@
+import json
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from ..dependencies.db_connection import DatabaseDependency
+from ..dependencies.oauth2 import CurrentActiveUserDependency, authenticate_token
+from ..dependencies.redis_connection import RedisDependency
+from ..models.models import ParkingLot
+from ..utils.space_updates import space_update_hub, space_update_messages
+
+router = APIRouter(
+    prefix='/parking-lots/{parking_lot_id}/parking-spaces',
+    tags=['ParkingSpaces']
+)
+
+
+async def get_active_parking_lot(db, parking_lot_id: int):
+    return await db.scalar(select(ParkingLot.id).where(ParkingLot.id == parking_lot_id, ParkingLot.is_active == True))
+
+
+@router.get('/events', status_code=status.HTTP_200_OK)
+async def stream_parking_space_events(
+        parking_lot_id: int,
+        db: DatabaseDependency,
+        current_active_user: CurrentActiveUserDependency
+):
+    if not await get_active_parking_lot(db, parking_lot_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parking lot not found')
+    subscription = await space_update_hub.subscribe(parking_lot_id)
+
+    async def events():
+        try:
+            async for message in space_update_messages(db, subscription):
+                if message['type'] == 'keepalive':
+                    yield ': keepalive\n\n'
+                else:
+                    yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            await space_update_hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@router.websocket('/ws')
+async def stream_parking_space_updates(
+        websocket: WebSocket,
+        parking_lot_id: int,
+        db: DatabaseDependency,
+        redis_client: RedisDependency,
+        token: str = Query()
+):
+    try:
+        current_user = await authenticate_token(token, redis_client, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if not current_user.is_active or not await get_active_parking_lot(db, parking_lot_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = await space_update_hub.subscribe(parking_lot_id)
+    try:
+        async for message in space_update_messages(db, subscription):
+            await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await space_update_hub.unsubscribe(subscription)
@@ -1,6 +1,7 @@
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, status, Query
+from sqlalchemy import literal_column, select
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from fastapi_pagination import Page
@@ -10,6 +11,8 @@ from ..models.schemas import VehicleCreate, VehicleCreateOut, VehicleOut
 from ..models.models import Vehicle
 from ..dependencies.db_connection import DatabaseDependency
 from ..dependencies.oauth2 import CurrentActiveUserDependency
+from ..utils.license_plates import normalize_license_plate
+from ..utils.serialization import json_response
 
 import base64
 
@@ -20,29 +23,34 @@ router = APIRouter(
 
 
 @router.get('/', response_model=Page[VehicleOut], status_code=status.HTTP_200_OK)
-def get_all_vehicles(
+async def get_all_vehicles(
         current_active_user: CurrentActiveUserDependency,
         db: DatabaseDependency,
         license_plate: Optional[str] = Query(default=None)
 ):
-    query = db.query(Vehicle).filter(Vehicle.owner_id == current_active_user.id)
+    query = select(Vehicle).where(Vehicle.owner_id == current_active_user.id)
     if license_plate is not None:
-        query = query.filter(Vehicle.license_plate.ilike(f'{license_plate.lower()}%'))
-    results = paginate(query)
+        # The normalised plate is alphanumeric, so it is inlined as a literal pattern that the planner can match to
+        # the prefix index
+        prefix = normalize_license_plate(license_plate)
+        query = query.where(Vehicle.normalized_license_plate.like(literal_column(f"'{prefix}%'")))
+    results = await paginate(db, query)
     if not results.items:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT)
-    return results
+    return json_response(Page[VehicleOut], results)
 
 
 @router.post('/', response_model=VehicleCreateOut, status_code=status.HTTP_201_CREATED)
-def create_vehicle(vehicle: VehicleCreate, current_active_user: CurrentActiveUserDependency, db: DatabaseDependency):
+async def create_vehicle(vehicle: VehicleCreate, current_active_user: CurrentActiveUserDependency,
+                         db: DatabaseDependency):
     try:
         new_vehicle = Vehicle(**vehicle.model_dump())
-        new_vehicle.owner = current_active_user
+        new_vehicle.normalized_license_plate = normalize_license_plate(new_vehicle.license_plate)
+        new_vehicle.owner_id = current_active_user.id
         new_vehicle.created_at = datetime.utcnow()
         db.add(new_vehicle)
-        db.commit()
-        db.refresh(new_vehicle)
+        await db.commit()
+        await db.refresh(new_vehicle)
         return new_vehicle
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Vehicle already exists')
@@ -52,20 +60,20 @@ def create_vehicle(vehicle: VehicleCreate, current_active_user: CurrentActiveUse
 
 
 @router.get('/{vehicle_id}', response_model=VehicleOut, status_code=status.HTTP_200_OK)
-def get_vehicle_id(vehicle_id: int, current_active_user: CurrentActiveUserDependency, db: DatabaseDependency):
-    vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+async def get_vehicle_id(vehicle_id: int, current_active_user: CurrentActiveUserDependency, db: DatabaseDependency):
+    vehicle = await db.scalar(select(Vehicle).where(Vehicle.id == vehicle_id))
     if (not vehicle) or vehicle.owner_id != current_active_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Vehicle not found')
     return vehicle
 
 
 @router.delete('/{vehicle_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_vehicle(vehicle_id: int, current_active_user: CurrentActiveUserDependency, db: DatabaseDependency):
-    vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+async def delete_vehicle(vehicle_id: int, current_active_user: CurrentActiveUserDependency, db: DatabaseDependency):
+    vehicle = await db.scalar(select(Vehicle).where(Vehicle.id == vehicle_id))
     if not vehicle:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Vehicle not found')
     if vehicle.owner_id != current_active_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not allowed')
-    db.delete(vehicle)
-    db.commit()
+    await db.delete(vehicle)
+    await db.commit()
     return
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+from redis import asyncio as aioredis
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import Alert
+from ..models.schemas import AlertOut, AlertType
+from .serialization import serialize
+from .watchlist import watchlist
+
+logger = logging.getLogger(__name__)
+
+ALERTS_CHANNEL = 'alerts'
+ALERTS_STREAM_KEEPALIVE_SECONDS = float(os.getenv('ALERTS_STREAM_KEEPALIVE_SECONDS', 15))
+ALERTS_STREAM_MAX_PENDING = int(os.getenv('ALERTS_STREAM_MAX_PENDING', 1000))
+ALERTS_STREAM_REORDER_WINDOW = int(os.getenv('ALERTS_STREAM_REORDER_WINDOW', 100))
+ALERTS_REPLAY_LIMIT = 1000
+
+ALERT_COLUMNS = (Alert.id, Alert.alert_type, Alert.vehicle_id, Alert.license_plate, Alert.parking_lot_id,
+                 Alert.activity_type, Alert.timestamp, Alert.created_at)
+
+
+async def add_tracked_vehicle_alerts(db: AsyncSession, activity_logs: list, license_plates: dict) -> list:
+    # Must run inside the transaction that writes the activity logs. Returns the new alerts, to be published with
+    # publish_alerts once the transaction has committed.
+    tracked_vehicle_ids = await watchlist.tracked(db, {activity_log['vehicle_id'] for activity_log in activity_logs})
+    alerts = [{
+        'alert_type': AlertType.tracked_vehicle.value,
+        'vehicle_id': activity_log['vehicle_id'],
+        'license_plate': license_plates[activity_log['vehicle_id']],
+        'parking_lot_id': activity_log['parking_lot_id'],
+        'activity_type': activity_log['activity_type'],
+        'timestamp': activity_log['timestamp']
+    } for activity_log in activity_logs if activity_log['vehicle_id'] in tracked_vehicle_ids]
+    if not alerts:
+        return []
+    return [row._asdict() for row in await db.execute(insert(Alert).values(alerts).returning(*ALERT_COLUMNS))]
+
+
+async def publish_alerts(redis_client: aioredis.Redis, alerts: list):
+    if not alerts:
+        return
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for alert in alerts:
+            pipeline.publish(ALERTS_CHANNEL, serialize(AlertOut, alert))
+        await pipeline.execute()
+    except aioredis.RedisError as e:
+        # The alerts are committed, and streams pick them up from the table when they reconnect
+        logger.warning('Could not publish %d alerts: %s', len(alerts), e)
+
+
+async def load_alerts_after(db: AsyncSession, last_id: int) -> list:
+    rows = await db.execute(select(*ALERT_COLUMNS).where(Alert.id > last_id).order_by(Alert.id)
+                            .limit(ALERTS_REPLAY_LIMIT))
+    return [row._asdict() for row in rows]
+
+
+async def load_recent_alert_ids(db: AsyncSession, limit: int) -> list:
+    return list(await db.scalars(select(Alert.id).order_by(Alert.id.desc()).limit(limit)))
+
+
+class DeliveredAlerts:
+    # Ids sent on one stream. Alerts commit, and so are published, in any order, so an alert below the highest id
+    # sent is still delivered as long as it is within the reorder window.
+    def __init__(self, window: int):
+        self.window = window
+        self.highest = 0
+        self._ids = set()
+
+    @property
+    def floor(self) -> int:
+        return self.highest - self.window
+
+    def add(self, alert_id: int) -> bool:
+        if alert_id <= self.floor or alert_id in self._ids:
+            return False
+        self._ids.add(alert_id)
+        if alert_id > self.highest:
+            self.highest = alert_id
+            self._ids = {delivered_id for delivered_id in self._ids if delivered_id > self.floor}
+        return True
+
+
+class AlertSubscription:
+    def __init__(self):
+        self.resync_required = False
+        self._pending = []
+        self._ready = asyncio.Event()
+
+    def push(self, alert: dict):
+        if len(self._pending) >= ALERTS_STREAM_MAX_PENDING:
+            # A subscriber this far behind reloads from the table instead of holding more alerts in memory
+            self.require_resync()
+            return
+        self._pending.append(alert)
+        self._ready.set()
+
+    def require_resync(self):
+        self.resync_required = True
+        self._pending = []
+        self._ready.set()
+
+    async def next_alerts(self) -> Optional[list]:
+        # Returns the alerts received since the last call, or None when some may have been missed and the
+        # subscriber has to reload them from the table
+        await self._ready.wait()
+        self._ready.clear()
+        if self.resync_required:
+            self.resync_required = False
+            return None
+        alerts, self._pending = self._pending, []
+        return alerts
+
+
+class AlertHub:
+    # One Redis subscription per worker, shared by all of the worker's alert streams
+    def __init__(self):
+        self._subscriptions = set()
+
+    def start(self, redis_client: aioredis.Redis):
+        return asyncio.create_task(self._run(redis_client))
+
+    def subscribe(self) -> AlertSubscription:
+        subscription = AlertSubscription()
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AlertSubscription):
+        self._subscriptions.discard(subscription)
+
+    async def _run(self, redis_client: aioredis.Redis):
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(ALERTS_CHANNEL)
+                async for message in pubsub.listen():
+                    alert = json.loads(message['data'])
+                    for subscription in self._subscriptions:
+                        subscription.push(alert)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('Alert listener failed: %s', e)
+                for subscription in self._subscriptions:
+                    subscription.require_resync()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+alert_hub = AlertHub()
+
+
+async def alert_messages(db: AsyncSession, subscription: AlertSubscription, last_id: Optional[int]):
+    # The subscription is taken before the table is read, so no alert can fall between the two. Without a last id
+    # the stream starts after the alerts already committed. With one, the reorder window before it is replayed
+    # first, so an alert that committed after the client received a higher id is not lost, and the client drops
+    # the ids it already has.
+    delivered = DeliveredAlerts(ALERTS_STREAM_REORDER_WINDOW)
+    if last_id is None:
+        for alert_id in reversed(await load_recent_alert_ids(db, ALERTS_STREAM_REORDER_WINDOW)):
+            delivered.add(alert_id)
+        resync_required = False
+    else:
+        delivered.add(last_id)
+        resync_required = True
+    await db.close()
+    replay_after = delivered.floor
+    while True:
+        if resync_required:
+            alerts = await load_alerts_after(db, replay_after)
+            await db.close()
+            # A full page may have more behind it, so keep reading until the table is caught up
+            resync_required = len(alerts) == ALERTS_REPLAY_LIMIT
+            if alerts:
+                replay_after = alerts[-1]['id']
+        else:
+            try:
+                alerts = await asyncio.wait_for(subscription.next_alerts(), timeout=ALERTS_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if alerts is None:
+                resync_required = True
+                replay_after = delivered.floor
+                continue
+        for alert in alerts:
+            if delivered.add(alert['id']):
+                yield alert
@@ -0,0 +1,52 @@
+import logging
+import os
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 5000))
+
+
+class RowError:
+    def __init__(self, detail: str):
+        self.detail = detail
+
+
+def check_bulk_size(count: int):
+    if count == 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Nothing to create')
+    if count > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'At most {BULK_MAX_ITEMS} items can be created per request')
+
+
+def error_detail(e: DBAPIError) -> str:
+    if isinstance(e, IntegrityError):
+        return 'Conflicts with an existing record'
+    return 'Invalid values'
+
+
+async def insert_returning(db: AsyncSession, statement, rows: list, batch_size: int = BULK_BATCH_SIZE) -> list:
+    # Returns one entry per row, in the same order: the RETURNING row, or a RowError. Each batch is sent as a single
+    # multi-row INSERT inside a savepoint. A batch that fails is retried row by row, so only the rows at fault are lost
+    # and the surrounding transaction carries on. The statement needs sort_by_parameter_order=True in its returning().
+    results = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            async with db.begin_nested():
+                results.extend((await db.execute(statement, batch)).all())
+            continue
+        except DBAPIError as e:
+            logger.info('Bulk insert batch of %d rows failed, retrying row by row: %s', len(batch), e)
+        for row in batch:
+            try:
+                async with db.begin_nested():
+                    results.append((await db.execute(statement, [row])).one())
+            except DBAPIError as e:
+                results.append(RowError(error_detail(e)))
+    return results
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+from redis import asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import Camera, ParkingSpace, Sensor
+
+logger = logging.getLogger(__name__)
+
+DEVICE_INVALIDATION_CHANNEL = 'devices:invalidate'
+
+
+@dataclass(frozen=True)
+class CameraSnapshot:
+    id: UUID
+    parking_lot_id: Optional[int]
+
+
+@dataclass(frozen=True)
+class SensorSnapshot:
+    id: UUID
+    parking_space_id: Optional[int]
+    parking_lot_id: Optional[int]
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DeviceKeyCache:
+    # The bloom filter holds every active key, so unknown keys are rejected without a lookup. Devices behind
+    # keys that pass the filter are kept in a bounded LRU, and keys found to be invalid (false positives,
+    # deleted devices) in a short-lived negative cache. Until the first rebuild every lookup hits the database.
+    def __init__(self, max_size: int, negative_ttl: int, error_rate: float):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.error_rate = error_rate
+        self._filter = None
+        self._devices = OrderedDict()
+        self._invalid_keys = OrderedDict()
+        self._changes_during_rebuild = None
+        # Keys with a database load in flight, and how often each was added or removed since, so that a load that
+        # raced with a change is not cached
+        self._loads = {}
+        self._generations = {}
+
+    async def lookup(self, api_key: str, load):
+        if self._filter is not None and api_key not in self._filter:
+            return None
+        expires_at = self._invalid_keys.get(api_key)
+        if expires_at is not None:
+            if expires_at > time.time():
+                return None
+            del self._invalid_keys[api_key]
+        device = self._devices.get(api_key)
+        if device is not None:
+            self._devices.move_to_end(api_key)
+            return device
+        self._loads[api_key] = self._loads.get(api_key, 0) + 1
+        generation = self._generations.get(api_key, 0)
+        try:
+            device = await load()
+        finally:
+            changed = self._generations.get(api_key, 0) != generation
+            self._loads[api_key] -= 1
+            if not self._loads[api_key]:
+                del self._loads[api_key]
+                self._generations.pop(api_key, None)
+        if changed:
+            return device
+        if device is None:
+            self._set_invalid(api_key)
+        else:
+            self._set_device(api_key, device)
+        return device
+
+    def add_key(self, api_key: str):
+        if self._changes_during_rebuild is not None:
+            self._changes_during_rebuild.append((self.add_key, api_key))
+        self._key_changed(api_key)
+        if self._filter is not None:
+            self._filter.add(api_key)
+        self._invalid_keys.pop(api_key, None)
+
+    def remove_key(self, api_key: str):
+        if self._changes_during_rebuild is not None:
+            self._changes_during_rebuild.append((self.remove_key, api_key))
+        self._key_changed(api_key)
+        self._devices.pop(api_key, None)
+
+    def _key_changed(self, api_key: str):
+        if api_key in self._loads:
+            self._generations[api_key] = self._generations.get(api_key, 0) + 1
+
+    def begin_rebuild(self):
+        self._changes_during_rebuild = []
+
+    def finish_rebuild(self, devices: dict):
+        bloom_filter = BloomFilter(capacity=max(2 * len(devices), 1000), error_rate=self.error_rate)
+        for api_key in devices:
+            bloom_filter.add(api_key)
+        self._filter = bloom_filter
+        self._devices = OrderedDict()
+        for api_key, device in list(devices.items())[:self.max_size]:
+            self._devices[api_key] = device
+        self._invalid_keys.clear()
+        changes, self._changes_during_rebuild = self._changes_during_rebuild or [], None
+        for change, api_key in changes:
+            change(api_key)
+
+    def abort_rebuild(self):
+        self._changes_during_rebuild = None
+
+    def reset(self):
+        self._filter = None
+        self._devices.clear()
+        self._invalid_keys.clear()
+
+    def _set_device(self, api_key: str, device):
+        self._devices[api_key] = device
+        while len(self._devices) > self.max_size:
+            self._devices.popitem(last=False)
+
+    def _set_invalid(self, api_key: str):
+        self._invalid_keys[api_key] = time.time() + self.negative_ttl
+        while len(self._invalid_keys) > self.max_size:
+            self._invalid_keys.popitem(last=False)
+
+
+def create_device_key_cache():
+    return DeviceKeyCache(
+        max_size=int(os.getenv('DEVICE_CACHE_MAX_SIZE', 100000)),
+        negative_ttl=int(os.getenv('DEVICE_CACHE_NEGATIVE_TTL_SECONDS', 60)),
+        error_rate=float(os.getenv('DEVICE_CACHE_BLOOM_ERROR_RATE', 0.001)),
+    )
+
+
+camera_key_cache = create_device_key_cache()
+sensor_key_cache = create_device_key_cache()
+device_key_caches = {'camera': camera_key_cache, 'sensor': sensor_key_cache}
+
+
+def select_cameras():
+    return select(Camera.api_key, Camera.id, Camera.parking_lot_id).where(Camera.is_active == True)
+
+
+def select_sensors():
+    return select(Sensor.api_key, Sensor.id, Sensor.parking_space_id, ParkingSpace.parking_lot_id) \
+        .outerjoin(Sensor.parking_space) \
+        .where(Sensor.is_active == True)
+
+
+async def load_camera(db: AsyncSession, api_key: str) -> Optional[CameraSnapshot]:
+    row = (await db.execute(select_cameras().where(Camera.api_key == api_key))).first()
+    return CameraSnapshot(id=row.id, parking_lot_id=row.parking_lot_id) if row else None
+
+
+async def load_sensor(db: AsyncSession, api_key: str) -> Optional[SensorSnapshot]:
+    row = (await db.execute(select_sensors().where(Sensor.api_key == api_key))).first()
+    return SensorSnapshot(id=row.id, parking_space_id=row.parking_space_id,
+                          parking_lot_id=row.parking_lot_id) if row else None
+
+
+async def rebuild_device_caches(session_factory):
+    for cache in device_key_caches.values():
+        cache.begin_rebuild()
+    try:
+        async with session_factory() as db:
+            cameras = {row.api_key: CameraSnapshot(id=row.id, parking_lot_id=row.parking_lot_id)
+                       for row in await db.execute(select_cameras())}
+            sensors = {row.api_key: SensorSnapshot(id=row.id, parking_space_id=row.parking_space_id,
+                                                   parking_lot_id=row.parking_lot_id)
+                       for row in await db.execute(select_sensors())}
+    except BaseException:
+        for cache in device_key_caches.values():
+            cache.abort_rebuild()
+        raise
+    camera_key_cache.finish_rebuild(cameras)
+    sensor_key_cache.finish_rebuild(sensors)
+
+
+async def device_added(redis_client: aioredis.Redis, device_type: str, api_key: str):
+    device_key_caches[device_type].add_key(api_key)
+    await redis_client.publish(DEVICE_INVALIDATION_CHANNEL, f'{device_type}:add:{api_key}')
+
+
+async def devices_added(redis_client: aioredis.Redis, device_type: str, api_keys: list):
+    if not api_keys:
+        return
+    pipeline = redis_client.pipeline(transaction=False)
+    for api_key in api_keys:
+        device_key_caches[device_type].add_key(api_key)
+        pipeline.publish(DEVICE_INVALIDATION_CHANNEL, f'{device_type}:add:{api_key}')
+    await pipeline.execute()
+
+
+async def device_removed(redis_client: aioredis.Redis, device_type: str, api_key: str):
+    device_key_caches[device_type].remove_key(api_key)
+    await redis_client.publish(DEVICE_INVALIDATION_CHANNEL, f'{device_type}:remove:{api_key}')
+
+
+def handle_device_invalidation(message: str):
+    device_type, action, api_key = message.split(':', 2)
+    cache = device_key_caches.get(device_type)
+    if cache is None:
+        return
+    if action == 'add':
+        cache.add_key(api_key)
+    elif action == 'remove':
+        cache.remove_key(api_key)
+
+
+async def listen_for_device_changes(redis_client: aioredis.Redis, session_factory):
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(DEVICE_INVALIDATION_CHANNEL)
+            # Changes published while this worker was not subscribed are lost, so reload every key
+            await rebuild_device_caches(session_factory)
+            async for message in pubsub.listen():
+                handle_device_invalidation(message['data'].decode('utf8'))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Device cache listener failed: %s', e)
+            for cache in device_key_caches.values():
+                cache.reset()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,62 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 12
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+
+def encode(latitude: float, longitude: float, precision: int = MAX_PRECISION) -> str:
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value_range, value = (longitude_range, longitude) if even else (latitude_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision: int):
+    longitude_bits = (5 * precision + 1) // 2
+    latitude_bits = 5 * precision // 2
+    return 180.0 / 2 ** latitude_bits, 360.0 / 2 ** longitude_bits
+
+
+def covering_prefixes(latitude: float, longitude: float, radius: float):
+    # Picks the finest precision whose cells are at least radius wide, so that the circle around the point
+    # is covered by the point's cell and its eight neighbours. Returns None when even a single-character
+    # cell is too small, in which case the caller should not filter on the geohash at all.
+    radius_degrees = radius / METERS_PER_DEGREE
+    widest_latitude = min(abs(latitude) + radius_degrees, 90.0)
+    for precision in range(MAX_PRECISION, 0, -1):
+        latitude_degrees, longitude_degrees = cell_size(precision)
+        height = latitude_degrees * METERS_PER_DEGREE
+        width = longitude_degrees * METERS_PER_DEGREE * math.cos(math.radians(widest_latitude))
+        if height >= radius and width >= radius:
+            break
+    else:
+        return None
+    prefixes = set()
+    for latitude_offset in (-1, 0, 1):
+        for longitude_offset in (-1, 0, 1):
+            neighbour_latitude = latitude + latitude_offset * latitude_degrees
+            if not -90.0 <= neighbour_latitude <= 90.0:
+                continue
+            neighbour_longitude = (longitude + longitude_offset * longitude_degrees + 180.0) % 360.0 - 180.0
+            prefixes.add(encode(neighbour_latitude, neighbour_longitude, precision))
+    return sorted(prefixes)
@@ -0,0 +1,35 @@
+import os
+import re
+
+LICENSE_PLATE_SIMILARITY_THRESHOLD = float(os.getenv('LICENSE_PLATE_SIMILARITY_THRESHOLD', 0.25))
+
+NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+# Letters that plate readers commonly confuse with digits are folded onto the digit, so that a misread such as
+# 51B-0O123 and the registered 518-00123 share one normalised form
+CONFUSABLE_CHARACTERS = str.maketrans('ODQILZSGB', '000112568')
+
+
+def normalize_license_plate(license_plate: str) -> str:
+    return NON_ALPHANUMERIC.sub('', license_plate.upper()).translate(CONFUSABLE_CHARACTERS)
+
+
+def edit_distance(source: str, target: str) -> int:
+    # Levenshtein distance, keeping only one row of the table
+    if len(source) < len(target):
+        source, target = target, source
+    previous = list(range(len(target) + 1))
+    for i, source_character in enumerate(source, 1):
+        current = [i]
+        for j, target_character in enumerate(target, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (source_character != target_character)))
+        previous = current
+    return previous[-1]
+
+
+def match_distance(query: str, normalized_license_plate: str) -> int:
+    # A plate that starts with the query is an exact prefix match, anything else is ranked by how many edits it is
+    # away from the query
+    if normalized_license_plate.startswith(query):
+        return 0
+    return edit_distance(query, normalized_license_plate)
@@ -0,0 +1,97 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from redis.asyncio.client import Pipeline, Redis
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.routing import Match
+
+UNMATCHED_ROUTE = '<unmatched>'
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP request latency by route template',
+                             ['method', 'route'])
+REQUESTS = Counter('http_requests', 'HTTP responses by route template and status code', ['method', 'route', 'status'])
+REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP requests being handled by route template',
+                             ['method', 'route'])
+DB_POOL_CHECKOUT_DURATION = Histogram('db_pool_checkout_duration_seconds',
+                                      'Time spent waiting for a connection from the database pool',
+                                      buckets=FAST_BUCKETS)
+DB_POOL_CHECKED_OUT = Gauge('db_pool_connections_checked_out', 'Database connections currently checked out')
+REDIS_COMMAND_DURATION = Histogram('redis_command_duration_seconds', 'Redis call latency by command', ['command'],
+                                   buckets=FAST_BUCKETS)
+
+
+def route_template(scope) -> str:
+    # Label by the path template rather than the raw path, so that ids do not create a series per object
+    partial = None
+    for route in scope['app'].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        method = scope['method']
+        route = route_template(scope)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        # Covers both waiting for a returned connection and opening a new one when the pool may overflow
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - start)
+
+
+def command_name(command) -> str:
+    return (command.decode('utf8') if isinstance(command, bytes) else str(command)).upper()
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels('PIPELINE').observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(Redis):
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(command_name(args[0])).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
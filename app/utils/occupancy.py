@@ -0,0 +1,104 @@
+from collections import Counter
+
+from redis import asyncio as aioredis
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import ParkingSpace
+from ..models.schemas import ParkingSpaceState, VehicleType
+
+OCCUPANCY_KEY_PATTERN = 'parking_lots:*:occupancy'
+OCCUPANCY_FILL_LOCK_KEY = 'occupancy:fill_lock'
+OCCUPANCY_FILL_LOCK_SECONDS = 60
+
+
+def occupancy_key(parking_lot_id: int) -> str:
+    return f'parking_lots:{parking_lot_id}:occupancy'
+
+
+def occupancy_field(vehicle_type: str, state: str) -> str:
+    return f'{vehicle_type}:{state}'
+
+
+def other_state(state: str) -> str:
+    return ParkingSpaceState.occupied.value if state == ParkingSpaceState.free.value else ParkingSpaceState.free.value
+
+
+async def record_state_changes(redis_client: aioredis.Redis, changes):
+    # changes are (parking_lot_id, vehicle_type, old_state, new_state) tuples, where old_state is None for a
+    # newly created space and new_state is None for a deleted one
+    deltas = Counter()
+    for parking_lot_id, vehicle_type, old_state, new_state in changes:
+        if old_state is not None:
+            deltas[(parking_lot_id, occupancy_field(vehicle_type, old_state))] -= 1
+        if new_state is not None:
+            deltas[(parking_lot_id, occupancy_field(vehicle_type, new_state))] += 1
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    pipeline = redis_client.pipeline(transaction=True)
+    for (parking_lot_id, field), delta in deltas.items():
+        pipeline.hincrby(occupancy_key(parking_lot_id), field, delta)
+    await pipeline.execute()
+
+
+async def get_availability(redis_client: aioredis.Redis, parking_lot_id: int):
+    counters = {field.decode('utf8'): int(value)
+                for field, value in (await redis_client.hgetall(occupancy_key(parking_lot_id))).items()}
+    return [
+        {
+            'vehicle_type': vehicle_type.value,
+            'free': max(counters.get(occupancy_field(vehicle_type.value, ParkingSpaceState.free.value), 0), 0),
+            'occupied': max(counters.get(occupancy_field(vehicle_type.value, ParkingSpaceState.occupied.value), 0), 0)
+        }
+        for vehicle_type in VehicleType
+    ]
+
+
+async def count_occupancy(db: AsyncSession) -> dict:
+    rows = await db.execute(select(ParkingSpace.parking_lot_id, ParkingSpace.vehicle_type, ParkingSpace.state,
+                                   func.count())
+                            .where(ParkingSpace.is_active == True)
+                            .group_by(ParkingSpace.parking_lot_id, ParkingSpace.vehicle_type, ParkingSpace.state))
+    counters = {}
+    for parking_lot_id, vehicle_type, state, count in rows:
+        counters.setdefault(parking_lot_id, {})[occupancy_field(vehicle_type, state)] = count
+    return counters
+
+
+async def fill_missing_occupancy(db: AsyncSession, redis_client: aioredis.Redis) -> int:
+    # Run by every worker on startup, so it only fills lots that have no counters at all (a new or flushed Redis)
+    # and never overwrites counters that live workers keep incrementing. Counters that drifted are reset by the
+    # full rebuild in app.jobs.rebuild_occupancy_index.
+    if not await redis_client.set(OCCUPANCY_FILL_LOCK_KEY, 1, nx=True, ex=OCCUPANCY_FILL_LOCK_SECONDS):
+        return 0
+    try:
+        counters = await count_occupancy(db)
+        if not counters:
+            return 0
+        pipeline = redis_client.pipeline(transaction=False)
+        for parking_lot_id in counters:
+            pipeline.exists(occupancy_key(parking_lot_id))
+        missing = [parking_lot_id for parking_lot_id, exists in zip(counters, await pipeline.execute()) if not exists]
+        pipeline = redis_client.pipeline(transaction=False)
+        for parking_lot_id in missing:
+            for field, count in counters[parking_lot_id].items():
+                pipeline.hsetnx(occupancy_key(parking_lot_id), field, count)
+        await pipeline.execute()
+        return len(missing)
+    finally:
+        await redis_client.delete(OCCUPANCY_FILL_LOCK_KEY)
+
+
+async def rebuild_occupancy_index(db: AsyncSession, redis_client: aioredis.Redis) -> int:
+    # Replaces every counter, so increments made between the count and the write are lost. Run it as a
+    # reconciliation job, not from the app.
+    counters = await count_occupancy(db)
+    stale_keys = [key async for key in redis_client.scan_iter(match=OCCUPANCY_KEY_PATTERN)]
+    pipeline = redis_client.pipeline(transaction=True)
+    if stale_keys:
+        pipeline.delete(*stale_keys)
+    for parking_lot_id, fields in counters.items():
+        pipeline.hset(occupancy_key(parking_lot_id), mapping=fields)
+    await pipeline.execute()
+    return len(counters)
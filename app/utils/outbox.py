@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import suppress
+from datetime import datetime, timedelta
+
+from redis import asyncio as aioredis
+from redis.exceptions import LockError
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from ..models.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_SINK = os.getenv('OUTBOX_SINK', 'kafka')
+OUTBOX_FILE_PATH = os.getenv('OUTBOX_FILE_PATH', 'outbox_events.jsonl')
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv('OUTBOX_POLL_INTERVAL_SECONDS', 1))
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', 24))
+KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092')
+OUTBOX_PUBLISH_TIMEOUT_SECONDS = float(os.getenv('OUTBOX_PUBLISH_TIMEOUT_SECONDS', 10))
+OUTBOX_DISPATCH_LEASE_SECONDS = float(os.getenv('OUTBOX_DISPATCH_LEASE_SECONDS', 30))
+OUTBOX_DISPATCH_PARTITIONS = int(os.getenv('OUTBOX_DISPATCH_PARTITIONS', 4))
+
+PARKING_SPACE_TOPIC = os.getenv('OUTBOX_PARKING_SPACE_TOPIC', 'parking_space_events')
+ACTIVITY_LOG_TOPIC = os.getenv('OUTBOX_ACTIVITY_LOG_TOPIC', 'activity_log_events')
+
+
+def parking_space_event(event_type: str, parking_lot_id: int, parking_space_id: int, vehicle_type: str,
+                        state, timestamp: datetime):
+    return {
+        'topic': PARKING_SPACE_TOPIC,
+        'key': str(parking_lot_id),
+        'payload': {
+            'type': f'parking_space.{event_type}',
+            'parking_lot_id': parking_lot_id,
+            'parking_space_id': parking_space_id,
+            'vehicle_type': vehicle_type,
+            'state': state,
+            'timestamp': timestamp.isoformat()
+        }
+    }
+
+
+def activity_log_event(activity_log):
+    return {
+        'topic': ACTIVITY_LOG_TOPIC,
+        'key': str(activity_log.parking_lot_id),
+        'payload': {
+            'type': 'activity_log.created',
+            'id': activity_log.id,
+            'activity_type': activity_log.activity_type,
+            'vehicle_id': activity_log.vehicle_id,
+            'parking_lot_id': activity_log.parking_lot_id,
+            'timestamp': activity_log.timestamp.isoformat()
+        }
+    }
+
+
+async def add_outbox_events(db: AsyncSession, events: list):
+    # Must run inside the transaction that makes the change, so that an event exists if and only if it committed
+    if events:
+        await db.execute(insert(OutboxEvent).values(events))
+
+
+class MemorySink:
+    def __init__(self):
+        self.events = []
+
+    async def publish(self, events):
+        self.events.extend(events)
+
+    async def close(self):
+        pass
+
+
+class FileSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines):
+        with open(self.path, 'a', encoding='utf8') as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+    async def publish(self, events):
+        await asyncio.to_thread(self._write, [json.dumps({
+            'id': event.id,
+            'topic': event.topic,
+            'key': event.key,
+            'payload': event.payload
+        }) + '\n' for event in events])
+
+    async def close(self):
+        pass
+
+
+class KafkaSink:
+    def __init__(self, bootstrap_servers: str):
+        self.bootstrap_servers = bootstrap_servers
+        self._producer = None
+
+    async def publish(self, events):
+        if self._producer is None:
+            from aiokafka import AIOKafkaProducer
+            producer = AIOKafkaProducer(bootstrap_servers=self.bootstrap_servers, acks='all',
+                                        enable_idempotence=True, linger_ms=5)
+            try:
+                await producer.start()
+            except Exception:
+                await producer.stop()
+                raise
+            self._producer = producer
+        deliveries = [
+            await self._producer.send(event.topic,
+                                      key=event.key.encode('utf8') if event.key is not None else None,
+                                      value=json.dumps(event.payload).encode('utf8'))
+            for event in events
+        ]
+        await asyncio.gather(*deliveries)
+
+    async def close(self):
+        if self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+
+
+def create_sink(name: str):
+    if name == 'kafka':
+        return KafkaSink(KAFKA_BOOTSTRAP_SERVERS)
+    if name == 'file':
+        return FileSink(OUTBOX_FILE_PATH)
+    if name == 'memory':
+        return MemorySink()
+    raise ValueError(f'Unknown outbox sink {name}')
+
+
+def dispatch_partition(key_column, partitions: int):
+    # Every event of a key falls in the same partition, whatever the number of workers
+    return func.coalesce(func.hashtext(key_column), 0).op('&')(0x7fffffff) % partitions
+
+
+async def dispatch_outbox_batch(engine: AsyncEngine, sink, batch_size: int, partition: int = 0,
+                                partitions: int = 1) -> int:
+    # Only the holder of the partition's lease calls this, so events of one key are published by one worker at a
+    # time and in id order. Rows are read and marked in two short transactions, so no connection or row lock is
+    # held while the sink publishes. They are only marked once the sink has accepted them, so a failure or crash
+    # in between publishes them again (at-least-once).
+    async with engine.connect() as conn:
+        events = (await conn.execute(select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.key, OutboxEvent.payload)
+                                     .where(OutboxEvent.dispatched_at == None,
+                                            dispatch_partition(OutboxEvent.key, partitions) == partition)
+                                     .order_by(OutboxEvent.id)
+                                     .limit(batch_size))).all()
+    if not events:
+        return 0
+    await asyncio.wait_for(sink.publish(events), timeout=OUTBOX_PUBLISH_TIMEOUT_SECONDS)
+    async with engine.begin() as conn:
+        await conn.execute(update(OutboxEvent)
+                           .where(OutboxEvent.id.in_([event.id for event in events]))
+                           .values(dispatched_at=datetime.utcnow()))
+    return len(events)
+
+
+async def hold_lease(lease) -> bool:
+    try:
+        if lease.local.token is not None:
+            await lease.reacquire()
+            return True
+    except LockError:
+        lease.local.token = None
+    return await lease.acquire(blocking=False)
+
+
+async def run_outbox_dispatcher(engine: AsyncEngine, redis_client: aioredis.Redis, sink, batch_size: int,
+                                poll_interval: float, partitions: int = OUTBOX_DISPATCH_PARTITIONS):
+    # Keys are split into partitions, each leased in Redis to one worker at a time. The lease outlives a publish
+    # that times out, so another worker only takes over a partition once its holder has stopped dispatching it.
+    leases = [redis_client.lock(f'outbox:dispatch:{partition}', timeout=OUTBOX_DISPATCH_LEASE_SECONDS,
+                                thread_local=False)
+              for partition in range(partitions)]
+    try:
+        while True:
+            dispatched = 0
+            for partition, lease in enumerate(leases):
+                try:
+                    if await hold_lease(lease):
+                        dispatched = max(dispatched, await dispatch_outbox_batch(engine, sink, batch_size,
+                                                                                 partition, partitions))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning('Outbox dispatch failed: %s', e)
+            if dispatched < batch_size:
+                await asyncio.sleep(poll_interval)
+    finally:
+        for lease in leases:
+            if lease.local.token is not None:
+                with suppress(Exception):
+                    await lease.release()
+        await sink.close()
+
+
+async def purge_dispatched_events(engine: AsyncEngine):
+    dispatched_before = datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS)
+    async with engine.begin() as conn:
+        await conn.execute(delete(OutboxEvent).where(OutboxEvent.dispatched_at < dispatched_before))
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+
+from fastapi import HTTPException, Query, status
+from fastapi_pagination import Page as BasePage
+from fastapi_pagination.api import resolve_params
+from fastapi_pagination.ext.sqlalchemy import count_query
+from pydantic import BaseModel
+from redis import asyncio as aioredis
+from sqlalchemy import BigInteger, DateTime, Integer, Select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+PAGINATION_TOTAL_CACHE_TTL_SECONDS = int(os.getenv('PAGINATION_TOTAL_CACHE_TTL_SECONDS', 30))
+
+T = TypeVar('T')
+
+
+class CursorParams(BaseModel):
+    cursor: Optional[str] = Query(default=None)
+    size: int = Query(default=50, ge=1, le=100)
+
+
+class CursorPage(BaseModel, Generic[T]):
+    items: List[T]
+    size: int
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf8')).decode('ascii')
+
+
+def decode_cursor_value(column, value):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    python_type = column.type.python_type
+    # bool is an int subclass, but never a valid key for an integer column
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise TypeError
+    if isinstance(column.type, Integer):
+        bits = 64 if isinstance(column.type, BigInteger) else 32
+        if not -2 ** (bits - 1) <= value < 2 ** (bits - 1):
+            raise ValueError
+    return value
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    # Every value is checked against its column type, so a tampered cursor is rejected here and not by the database
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [decode_cursor_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+
+async def paginate_by_keyset(db: AsyncSession, query: Select, params: CursorParams, columns: list,
+                             descending: bool = True):
+    # columns must end with a unique column so that the key is a total order over the rows
+    if params.cursor is not None:
+        cursor_values = decode_cursor(params.cursor, columns)
+        key = tuple_(*columns)
+        query = query.where(key < tuple_(*cursor_values) if descending else key > tuple_(*cursor_values))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    items = (await db.scalars(query.limit(params.size + 1))).all()
+    next_cursor = None
+    if len(items) > params.size:
+        items = items[:params.size]
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in columns])
+    return {
+        'items': items,
+        'size': params.size,
+        'next_cursor': next_cursor
+    }
+
+
+class Page(BasePage[T], Generic[T]):
+    has_next: Optional[bool] = None
+
+
+class ExactTotal:
+    async def count(self, db: AsyncSession, query: Select) -> int:
+        return await db.scalar(count_query(query))
+
+
+class CachedTotal(ExactTotal):
+    # Totals are shared for ttl seconds by every request with the same filters, so they may lag behind inserts
+    # and deletes by that much
+    def __init__(self, redis_client: aioredis.Redis, name: str, filters: dict,
+                 ttl: int = PAGINATION_TOTAL_CACHE_TTL_SECONDS):
+        self.redis_client = redis_client
+        self.key = total_cache_key(name, filters)
+        self.ttl = ttl
+
+    async def count(self, db: AsyncSession, query: Select) -> int:
+        try:
+            cached = await self.redis_client.get(self.key)
+        except aioredis.RedisError as e:
+            logger.warning('Could not read cached total: %s', e)
+            return await super().count(db, query)
+        if cached is not None:
+            return int(cached)
+        total = await super().count(db, query)
+        try:
+            await self.redis_client.set(self.key, total, ex=self.ttl)
+        except aioredis.RedisError as e:
+            logger.warning('Could not cache total: %s', e)
+        return total
+
+
+class EstimatedTotal(ExactTotal):
+    # The planner's row estimate for the whole table, only meaningful for queries without a WHERE clause
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    async def count(self, db: AsyncSession, query: Select) -> int:
+        estimate = await db.scalar(text('SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+                                   {'table': self.table_name})
+        if estimate is None or estimate < 0:
+            # The table has never been analyzed
+            return await super().count(db, query)
+        return int(estimate)
+
+
+def total_cache_key(name: str, filters: dict) -> str:
+    normalized = json.dumps({key: value for key, value in filters.items() if value is not None}, sort_keys=True,
+                            default=str)
+    return f'pagination:total:{name}:{hashlib.sha1(normalized.encode("utf8")).hexdigest()}'
+
+
+async def paginate_with_total(db: AsyncSession, query: Select, total: Optional[ExactTotal] = ExactTotal()):
+    # One extra row tells whether a next page exists. The total is only counted when the page does not end the
+    # result, and is left out when total is None.
+    params = resolve_params()
+    raw_params = params.to_raw_params()
+    items = (await db.scalars(query.limit(raw_params.limit + 1).offset(raw_params.offset))).unique().all()
+    has_next = len(items) > raw_params.limit
+    items = items[:raw_params.limit]
+    if not has_next and (items or raw_params.offset == 0):
+        count = raw_params.offset + len(items)
+    elif total is None:
+        count = None
+    else:
+        count = await total.count(db, query)
+        if has_next:
+            count = max(count, raw_params.offset + len(items) + 1)
+    return Page.create(items, params, total=count, has_next=has_next)
@@ -0,0 +1,143 @@
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from ..models.models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_LOG_PARTITIONS_AHEAD = int(os.getenv('ACTIVITY_LOG_PARTITIONS_AHEAD', 3))
+ACTIVITY_LOG_RETENTION_MONTHS = int(os.getenv('ACTIVITY_LOG_RETENTION_MONTHS', 12))
+ACTIVITY_LOG_ARCHIVE_DIR = os.getenv('ACTIVITY_LOG_ARCHIVE_DIR', 'archive')
+
+PARENT_TABLE = ActivityLog.__tablename__
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+PARTITION_NAME_PATTERN = re.compile(rf'^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$')
+# Arbitrary key for pg_advisory_xact_lock, shared by every worker and job that creates partitions
+PARTITION_MAINTENANCE_LOCK_ID = 7308895161
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f'{PARENT_TABLE}_{month:%Y_%m}'
+
+
+async def create_partition(conn: AsyncConnection, start: datetime):
+    # Postgres refuses to attach a range that the default partition already holds rows for, so those rows are
+    # moved out first and written back through the parent once the new partition exists
+    end = add_months(start, 1)
+    in_range = f"\"timestamp\" >= '{start.isoformat()}' AND \"timestamp\" < '{end.isoformat()}'"
+    moving = await conn.scalar(text(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})'))
+    if moving:
+        await conn.execute(text(f'CREATE TEMPORARY TABLE moving_{PARENT_TABLE} (LIKE {PARENT_TABLE}) ON COMMIT DROP'))
+        await conn.execute(text(f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *) '
+                                f'INSERT INTO moving_{PARENT_TABLE} SELECT * FROM moved'))
+    await conn.execute(text(
+        f"CREATE TABLE {partition_name(start)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    if moving:
+        await conn.execute(text(f'INSERT INTO {PARENT_TABLE} SELECT * FROM moving_{PARENT_TABLE}'))
+        await conn.execute(text(f'DROP TABLE moving_{PARENT_TABLE}'))
+        logger.info('Moved the rows for %s out of %s', start.strftime('%Y-%m'), DEFAULT_PARTITION)
+
+
+async def create_partitions(conn: AsyncConnection, months_ahead: int = ACTIVITY_LOG_PARTITIONS_AHEAD,
+                            months_behind: int = ACTIVITY_LOG_RETENTION_MONTHS):
+    # Partitions cover the retention period, so only rows older than it (late or migrated) land in the default
+    # partition. Ingestion never writes timestamps in the future, so it never holds rows for a month ahead.
+    # Creating a partition locks the parent table, so only the missing ones are created, one worker at a time.
+    await conn.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': PARTITION_MAINTENANCE_LOCK_ID})
+    existing = {name for _, name in await list_partitions(conn)}
+    if not await conn.scalar(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': DEFAULT_PARTITION}):
+        await conn.execute(text(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT'))
+    current_month = month_start(datetime.utcnow())
+    for offset in range(-months_behind, months_ahead + 1):
+        start = add_months(current_month, offset)
+        if partition_name(start) not in existing:
+            await create_partition(conn, start)
+
+
+async def partition_default_rows(conn: AsyncConnection) -> int:
+    # Gives every month still held by the default partition its own partition, so that archive_old_partitions
+    # exports and drops those rows with the rest once they are past retention
+    await conn.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': PARTITION_MAINTENANCE_LOCK_ID})
+    months = (await conn.scalars(text(
+        f'SELECT DISTINCT date_trunc(\'month\', "timestamp") FROM {DEFAULT_PARTITION} ORDER BY 1'
+    ))).all()
+    for month in months:
+        await create_partition(conn, month)
+    return len(months)
+
+
+async def list_partitions(conn: AsyncConnection):
+    rows = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = :parent"
+    ), {'parent': PARENT_TABLE})
+    partitions = []
+    for name, in rows:
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match:
+            partitions.append((datetime(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+async def archive_partition(conn: AsyncConnection, name: str, archive_dir: str) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    raw_connection = await conn.get_raw_connection()
+    with gzip.open(path, 'wb') as archive:
+        async def write(chunk):
+            archive.write(chunk)
+        await raw_connection.driver_connection.copy_from_table(name, output=write, format='csv', header=True)
+    return path
+
+
+async def archive_old_partitions(engine: AsyncEngine, retention_months: int = ACTIVITY_LOG_RETENTION_MONTHS,
+                                 archive_dir: str = ACTIVITY_LOG_ARCHIVE_DIR):
+    cutoff = add_months(month_start(datetime.utcnow()), -retention_months)
+    async with engine.connect() as conn:
+        partitions = await list_partitions(conn)
+    archived = []
+    for month, name in partitions:
+        if add_months(month, 1) > cutoff:
+            continue
+        async with engine.begin() as conn:
+            path = await archive_partition(conn, name, archive_dir)
+            await conn.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}'))
+            await conn.execute(text(f'DROP TABLE {name}'))
+        logger.info('Archived partition %s to %s', name, path)
+        archived.append(path)
+    return archived
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    return await conn.scalar(text('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table '
+                                  'WHERE partrelid = to_regclass(:name))'), {'name': PARENT_TABLE})
+
+
+async def maintain_partitions(engine: AsyncEngine) -> bool:
+    async with engine.begin() as conn:
+        # create_all leaves an activity_logs table from before partitioning as it is
+        if not await is_partitioned(conn):
+            logger.warning('%s is not partitioned, convert it with python -m app.jobs.partition_activity_logs',
+                           PARENT_TABLE)
+            return False
+        await create_partitions(conn)
+    return True
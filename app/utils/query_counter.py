@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine):
+    # Collects every statement sent through the engine (including the pagination COUNT) while the block runs
+    statements = []
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(sync_engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(sync_engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(engine, max_queries: int):
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > max_queries:
+        raise AssertionError(f'Expected at most {max_queries} SQL statements, got {len(statements)}:\n' +
+                             '\n'.join(statements))
@@ -0,0 +1,40 @@
+from sqlalchemy import Float, case, cast, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from ..models.models import ParkingLot
+
+
+async def apply_rating_change(db: AsyncSession, parking_lot_id: int, count_delta: int, sum_delta: int):
+    # The SET expressions all read the row's previous values, so concurrent changes to the same lot serialize
+    # on the row lock instead of overwriting each other
+    rating_count = ParkingLot.rating_count + count_delta
+    rating_sum = ParkingLot.rating_sum + sum_delta
+    await db.execute(update(ParkingLot)
+                     .where(ParkingLot.id == parking_lot_id)
+                     .values(rating_count=rating_count,
+                             rating_sum=rating_sum,
+                             rating_average=case(
+                                 (rating_count > 0, cast(rating_sum, Float) / cast(rating_count, Float)), else_=0
+                             ))
+                     .execution_options(synchronize_session=False))
+
+
+REBUILD_STATEMENT = """
+UPDATE parking_lots
+SET rating_count = coalesce(ratings.rating_count, 0),
+    rating_sum = coalesce(ratings.rating_sum, 0),
+    rating_average = coalesce(ratings.rating_sum::float / ratings.rating_count, 0)
+FROM parking_lots AS lots
+LEFT JOIN (
+    SELECT parking_lot_id, count(*) AS rating_count, sum(rating) AS rating_sum
+    FROM rating_feedbacks
+    WHERE is_active
+    GROUP BY parking_lot_id
+) AS ratings ON ratings.parking_lot_id = lots.id
+WHERE parking_lots.id = lots.id
+"""
+
+
+async def rebuild_rating_aggregates(conn: AsyncConnection) -> int:
+    result = await conn.execute(text(REBUILD_STATEMENT))
+    return result.rowcount
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 300))
+
+VERSION_KEY_PREFIX = 'response_cache:version:'
+PARKING_LOTS_TAG = 'parking_lots'
+
+
+def parking_lot_tag(parking_lot_id: int) -> str:
+    return f'{PARKING_LOTS_TAG}:{parking_lot_id}'
+
+
+def parking_lot_tags(parking_lot_id: int) -> list:
+    return [PARKING_LOTS_TAG, parking_lot_tag(parking_lot_id)]
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+async def get_tag_versions(redis_client: aioredis.Redis, tags: list) -> list:
+    # A tag version is the time in milliseconds of the tag's last change, or later. A tag with no version (new, or
+    # lost by Redis) starts at the current time, which is past any version it had before.
+    keys = [VERSION_KEY_PREFIX + tag for tag in tags]
+    versions = await redis_client.mget(keys)
+    if None in versions:
+        pipeline = redis_client.pipeline(transaction=False)
+        initial_version = now_ms()
+        for key, version in zip(keys, versions):
+            if version is None:
+                pipeline.set(key, initial_version, nx=True)
+        await pipeline.execute()
+        versions = await redis_client.mget(keys)
+    return [int(version) for version in versions]
+
+
+async def invalidate_tags(redis_client: aioredis.Redis, tags: list):
+    # Must run after the change is committed, so that a response read before the commit is never stored under the
+    # new version
+    keys = [VERSION_KEY_PREFIX + tag for tag in tags]
+
+    async def bump(pipeline):
+        versions = await pipeline.mget(keys)
+        version = now_ms()
+        pipeline.multi()
+        for key, current in zip(keys, versions):
+            pipeline.set(key, max(int(current or 0) + 1, version))
+
+    try:
+        await redis_client.transaction(bump, *keys)
+    except aioredis.RedisError as e:
+        logger.warning('Could not invalidate cached responses for %s: %s', tags, e)
+
+
+async def invalidate_tag_prefix(redis_client: aioredis.Redis, prefix: str):
+    # Dropping a version restarts it at the current time, so this invalidates every matching tag
+    keys = [key async for key in redis_client.scan_iter(match=f'{VERSION_KEY_PREFIX}{prefix}*', count=1000)]
+    if keys:
+        await redis_client.delete(*keys)
+
+
+class ResponseCache:
+    # Responses are stored under a key built from the tag versions, so invalidating a tag only bumps its version
+    # and the stale entries expire on their own. The ETag is derived from the same key and the newest updated_at of
+    # the response, and stored with the entry, so conditional requests on a cached response skip the database.
+    def __init__(self, redis_client: aioredis.Redis, name: str, variant: dict, tags: list,
+                 ttl: int = RESPONSE_CACHE_TTL_SECONDS):
+        self.redis_client = redis_client
+        self.name = name
+        self.variant = variant
+        self.tags = tags
+        self.ttl = ttl
+        self.request = None
+        self.fingerprint = None
+        self.key = None
+        self.last_modified = None
+
+    def response_headers(self, etag: Optional[str]) -> dict:
+        headers = {'Cache-Control': 'private, no-cache'}
+        if etag is not None:
+            headers['ETag'] = etag
+        if self.last_modified is not None:
+            headers['Last-Modified'] = formatdate(self.last_modified, usegmt=True)
+        return headers
+
+    async def lookup(self, request: Request) -> Optional[Response]:
+        self.request = request
+        try:
+            versions = await get_tag_versions(self.redis_client, self.tags)
+        except aioredis.RedisError as e:
+            logger.warning('Response cache unavailable: %s', e)
+            return None
+        self.fingerprint = hashlib.sha1(json.dumps([self.name, self.variant, versions], sort_keys=True, default=str)
+                                        .encode('utf8')).hexdigest()
+        self.key = f'response_cache:entry:{self.name}:{self.fingerprint}'
+        self.last_modified = max(versions) / 1000
+        try:
+            body, etag = await self.redis_client.hmget(self.key, ['body', 'etag'])
+        except aioredis.RedisError as e:
+            logger.warning('Response cache unavailable: %s', e)
+            return None
+        if body is None or etag is None:
+            return None
+        headers = self.response_headers(etag.decode('utf8'))
+        if is_not_modified(request, headers['ETag'], self.last_modified):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type='application/json', headers=headers)
+
+    async def store(self, body: bytes, updated_at: Optional[datetime] = None,
+                    status_code: int = status.HTTP_200_OK) -> Response:
+        # updated_at is the newest updated_at (or created_at) of the rows in the response
+        if self.key is None:
+            return Response(content=body, status_code=status_code, media_type='application/json',
+                            headers=self.response_headers(None))
+        etag_source = f'{self.fingerprint}:{updated_at.isoformat() if updated_at is not None else ""}'
+        etag = f'W/"{hashlib.sha1(etag_source.encode("utf8")).hexdigest()[:20]}"'
+        try:
+            pipeline = self.redis_client.pipeline(transaction=True)
+            pipeline.hset(self.key, mapping={'body': body, 'etag': etag})
+            pipeline.expire(self.key, self.ttl)
+            await pipeline.execute()
+        except aioredis.RedisError as e:
+            logger.warning('Could not cache response: %s', e)
+        headers = self.response_headers(etag)
+        if self.request is not None and is_not_modified(self.request, etag, self.last_modified):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, status_code=status_code, media_type='application/json', headers=headers)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # Weak comparison, as required for If-None-Match
+        candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+        return '*' in candidates or etag.removeprefix('W/') in candidates
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
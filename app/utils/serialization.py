@@ -0,0 +1,20 @@
+from functools import lru_cache
+
+from fastapi import Response, status
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def get_type_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def serialize(schema, content) -> bytes:
+    adapter = get_type_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True), by_alias=True)
+
+
+def json_response(schema, content, status_code: int = status.HTTP_200_OK) -> Response:
+    # Validates and encodes in pydantic-core in one pass, skipping FastAPI's response_model round trip through
+    # jsonable_encoder and json.dumps. The route should still declare the same schema as its response_model.
+    return Response(content=serialize(schema, content), status_code=status_code, media_type='application/json')
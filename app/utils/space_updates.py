@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+
+from redis import asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import ParkingSpace
+
+logger = logging.getLogger(__name__)
+
+SPACE_UPDATES_TICK_SECONDS = float(os.getenv('SPACE_UPDATES_TICK_SECONDS', 1))
+SPACE_UPDATES_KEEPALIVE_SECONDS = float(os.getenv('SPACE_UPDATES_KEEPALIVE_SECONDS', 15))
+
+
+def spaces_channel(parking_lot_id: int) -> str:
+    return f'parking_lots:{parking_lot_id}:spaces'
+
+
+async def publish_space_changes(redis_client: aioredis.Redis, changes):
+    # changes are (parking_lot_id, parking_space_id, vehicle_type, state) tuples, where state is None for a
+    # deleted space
+    messages = {}
+    for parking_lot_id, parking_space_id, vehicle_type, state in changes:
+        messages.setdefault(parking_lot_id, []).append({
+            'id': parking_space_id,
+            'vehicle_type': vehicle_type,
+            'state': state
+        })
+    if not messages:
+        return
+    pipeline = redis_client.pipeline(transaction=False)
+    for parking_lot_id, parking_spaces in messages.items():
+        pipeline.publish(spaces_channel(parking_lot_id), json.dumps(parking_spaces))
+    await pipeline.execute()
+
+
+async def load_space_snapshot(db: AsyncSession, parking_lot_id: int):
+    rows = await db.execute(select(ParkingSpace.id, ParkingSpace.vehicle_type, ParkingSpace.state)
+                            .where(ParkingSpace.parking_lot_id == parking_lot_id, ParkingSpace.is_active == True)
+                            .order_by(ParkingSpace.id))
+    return [{'id': id, 'vehicle_type': vehicle_type, 'state': state} for id, vehicle_type, state in rows]
+
+
+class SpaceSubscription:
+    def __init__(self, parking_lot_id: int):
+        self.parking_lot_id = parking_lot_id
+        self.snapshot_required = False
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def push(self, parking_spaces: dict):
+        self._pending.update(parking_spaces)
+        self._ready.set()
+
+    def require_snapshot(self):
+        self.snapshot_required = True
+        self._ready.set()
+
+    async def next_changes(self):
+        # Returns the changes accumulated since the last call, or None when updates may have been missed and
+        # the subscriber has to reload a snapshot. A slow subscriber only ever holds the latest state per space.
+        await self._ready.wait()
+        self._ready.clear()
+        if self.snapshot_required:
+            self.snapshot_required = False
+            self._pending = {}
+            return None
+        changes, self._pending = self._pending, {}
+        return list(changes.values())
+
+
+class SpaceUpdateHub:
+    # One Redis subscription per lot and worker, shared by all of the worker's WebSocket and SSE clients
+    def __init__(self, tick: float):
+        self.tick = tick
+        self._pubsub = None
+        self._subscriptions = {}
+        self._pending = {}
+        self._lock = None
+
+    def start(self, redis_client: aioredis.Redis):
+        self._pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self._lock = asyncio.Lock()
+        return asyncio.create_task(self._run())
+
+    async def subscribe(self, parking_lot_id: int) -> SpaceSubscription:
+        # The pubsub connection is shared with _run, so every command on it goes through the lock
+        subscription = SpaceSubscription(parking_lot_id)
+        async with self._lock:
+            subscriptions = self._subscriptions.setdefault(parking_lot_id, set())
+            subscriptions.add(subscription)
+            if len(subscriptions) == 1:
+                try:
+                    await self._pubsub.subscribe(spaces_channel(parking_lot_id))
+                except BaseException:
+                    del self._subscriptions[parking_lot_id]
+                    raise
+        return subscription
+
+    async def unsubscribe(self, subscription: SpaceSubscription):
+        async with self._lock:
+            subscriptions = self._subscriptions.get(subscription.parking_lot_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.parking_lot_id]
+                self._pending.pop(subscription.parking_lot_id, None)
+                try:
+                    await self._pubsub.unsubscribe(spaces_channel(subscription.parking_lot_id))
+                except Exception as e:
+                    # Messages still arriving on the channel are dropped by _receive
+                    logger.warning('Could not unsubscribe from parking lot %d: %s', subscription.parking_lot_id, e)
+
+    async def _run(self):
+        flush_task = asyncio.create_task(self._flush_periodically())
+        try:
+            while True:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(self.tick)
+                    continue
+                try:
+                    async with self._lock:
+                        message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=self.tick)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning('Parking space update listener failed: %s', e)
+                    for subscriptions in self._subscriptions.values():
+                        for subscription in subscriptions:
+                            subscription.require_snapshot()
+                    await asyncio.sleep(1)
+                    continue
+                if message is not None:
+                    self._receive(message)
+        finally:
+            flush_task.cancel()
+            await self._pubsub.aclose()
+
+    def _receive(self, message):
+        parking_lot_id = int(message['channel'].decode('utf8').split(':')[1])
+        if parking_lot_id not in self._subscriptions:
+            return
+        pending = self._pending.setdefault(parking_lot_id, {})
+        for parking_space in json.loads(message['data']):
+            pending[parking_space['id']] = parking_space
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            pending, self._pending = self._pending, {}
+            for parking_lot_id, parking_spaces in pending.items():
+                for subscription in self._subscriptions.get(parking_lot_id, ()):
+                    subscription.push(parking_spaces)
+
+
+space_update_hub = SpaceUpdateHub(tick=SPACE_UPDATES_TICK_SECONDS)
+
+
+async def space_update_messages(db: AsyncSession, subscription: SpaceSubscription):
+    # The subscription is taken before the snapshot is read, so no change can fall between the two. The session
+    # is closed after each snapshot to give its connection back to the pool while the client stays connected.
+    snapshot_required = True
+    while True:
+        if snapshot_required:
+            parking_spaces = await load_space_snapshot(db, subscription.parking_lot_id)
+            await db.close()
+            yield {'type': 'snapshot', 'parking_lot_id': subscription.parking_lot_id, 'parking_spaces': parking_spaces}
+        try:
+            changes = await asyncio.wait_for(subscription.next_changes(), timeout=SPACE_UPDATES_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            snapshot_required = False
+            yield {'type': 'keepalive'}
+            continue
+        snapshot_required = changes is None
+        if changes:
+            yield {'type': 'delta', 'parking_lot_id': subscription.parking_lot_id, 'parking_spaces': changes}
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILING_ENABLED = os.getenv('SQL_PROFILING_ENABLED', 'false').lower() == 'true'
+SQL_PROFILING_SLOW_QUERY_MS = float(os.getenv('SQL_PROFILING_SLOW_QUERY_MS', 100))
+SQL_PROFILING_TOP_STATEMENTS = int(os.getenv('SQL_PROFILING_TOP_STATEMENTS', 5))
+SQL_PROFILING_EXPLAIN_INTERVAL_SECONDS = int(os.getenv('SQL_PROFILING_EXPLAIN_INTERVAL_SECONDS', 300))
+
+WRITE_PATTERN = re.compile(r'\b(INSERT|UPDATE|DELETE|SHARE)\b')
+
+
+class RequestProfile:
+    def __init__(self):
+        self.statements = []
+        self.slow_statements = []
+
+    @property
+    def total_time(self) -> float:
+        return sum(duration for duration, _ in self.statements)
+
+    def slowest(self, count: int):
+        return sorted(self.statements, key=lambda item: item[0], reverse=True)[:count]
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('current_profile', default=None)
+
+
+def is_explainable(statement: str) -> bool:
+    # EXPLAIN ANALYZE runs the statement, so only plain reads are replayed, without row locks
+    normalized = statement.lstrip().upper()
+    return normalized.startswith(('SELECT', 'WITH')) and not WRITE_PATTERN.search(normalized)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        context.profiler_start_time = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    start = getattr(context, 'profiler_start_time', None)
+    if profile is None or start is None:
+        return
+    duration = time.perf_counter() - start
+    profile.statements.append((duration, statement))
+    if duration * 1000 >= SQL_PROFILING_SLOW_QUERY_MS and not executemany and is_explainable(statement):
+        profile.slow_statements.append((duration, statement, parameters))
+
+
+class QueryPlanCapture:
+    # Plans are captured one at a time on a separate connection after the response has been sent, and each
+    # statement at most once per interval, so that profiling a slow endpoint does not pile more load on the database
+    def __init__(self, engine: AsyncEngine, interval: int):
+        self.engine = engine
+        self.interval = interval
+        self._captured_at = {}
+        self._lock = None
+        self._tasks = set()
+
+    def schedule(self, route: str, duration: float, statement: str, parameters):
+        now = time.monotonic()
+        captured_at = self._captured_at.get(statement)
+        if captured_at is not None and now - captured_at < self.interval:
+            return
+        if len(self._captured_at) >= 1000:
+            self._captured_at = {key: value for key, value in self._captured_at.items()
+                                 if now - value < self.interval}
+        self._captured_at[statement] = now
+        task = asyncio.create_task(self.capture(route, duration, statement, parameters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def capture(self, route: str, duration: float, statement: str, parameters):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        try:
+            async with self._lock:
+                async with self.engine.connect() as conn:
+                    rows = await conn.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                    plan = '\n'.join(row[0] for row in rows)
+                    await conn.rollback()
+        except Exception as e:
+            logger.warning('Could not capture the plan of a slow SQL statement: %s', e)
+            return
+        logger.warning(json.dumps({
+            'event': 'slow_sql_statement',
+            'route': route,
+            'duration_ms': round(duration * 1000, 3),
+            'statement': statement,
+            'plan': plan
+        }))
+
+
+class SqlProfilerMiddleware:
+    def __init__(self, app, plan_capture: QueryPlanCapture):
+        self.app = app
+        self.plan_capture = plan_capture
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        status_code = 500
+
+        async def send_with_profile(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                header = f'db;dur={profile.total_time * 1000:.3f};desc="{len(profile.statements)} statements"'
+                message['headers'] = list(message.get('headers', [])) + [(b'server-timing', header.encode('latin-1'))]
+            await send(message)
+
+        token = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            current_profile.reset(token)
+            route = route_template(scope)
+            logger.info(json.dumps({
+                'event': 'sql_profile',
+                'method': scope['method'],
+                'route': route,
+                'path': scope['path'],
+                'status': status_code,
+                'statement_count': len(profile.statements),
+                'db_time_ms': round(profile.total_time * 1000, 3),
+                'slowest': [{'duration_ms': round(duration * 1000, 3), 'statement': statement}
+                            for duration, statement in profile.slowest(SQL_PROFILING_TOP_STATEMENTS)]
+            }))
+            for duration, statement, parameters in profile.slow_statements:
+                self.plan_capture.schedule(route, duration, statement, parameters)
+
+
+def install_sql_profiler(app, engine: AsyncEngine):
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
+    app.add_middleware(SqlProfilerMiddleware,
+                       plan_capture=QueryPlanCapture(engine, SQL_PROFILING_EXPLAIN_INTERVAL_SECONDS))
@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from ..models.models import ParkingLotHourlyStats
+from ..models.schemas import ActivityType
+
+
+# Arbitrary namespace for the per-lot pg_advisory_xact_lock taken while a lot's rollups are written
+STATS_LOCK_NAMESPACE = 730889517
+
+
+async def lock_parking_lot_stats(conn, parking_lot_id: int):
+    await conn.execute(text('SELECT pg_advisory_xact_lock(:namespace, :parking_lot_id)'),
+                       {'namespace': STATS_LOCK_NAMESPACE, 'parking_lot_id': parking_lot_id})
+
+
+def truncate_to_hour(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+async def record_activity_stats(db: AsyncSession, parking_lot_id: int, activity_logs: list):
+    # Reads are folded into the running occupancy in timestamp order. Reads arriving for an hour older than
+    # the lot's latest rollup are counted, but their effect on occupancy is only corrected by a backfill. The lock
+    # serialises batches of the same lot, including the first ones, when there is no rollup row to lock yet.
+    await lock_parking_lot_stats(db, parking_lot_id)
+    latest = (await db.execute(select(ParkingLotHourlyStats.closing_occupancy)
+                               .where(ParkingLotHourlyStats.parking_lot_id == parking_lot_id)
+                               .order_by(ParkingLotHourlyStats.hour.desc())
+                               .limit(1))).first()
+    occupancy = latest.closing_occupancy if latest else 0
+    hours = {}
+    for activity_log in sorted(activity_logs, key=lambda activity_log: activity_log['timestamp']):
+        hour = truncate_to_hour(activity_log['timestamp'])
+        stats = hours.setdefault(hour, {'entries': 0, 'exits': 0, 'peak_occupancy': occupancy})
+        if activity_log['activity_type'] == ActivityType.entry.value:
+            stats['entries'] += 1
+            occupancy += 1
+        else:
+            stats['exits'] += 1
+            occupancy -= 1
+        stats['peak_occupancy'] = max(stats['peak_occupancy'], occupancy)
+        stats['closing_occupancy'] = occupancy
+    if not hours:
+        return
+    statement = insert(ParkingLotHourlyStats).values([
+        {'parking_lot_id': parking_lot_id, 'hour': hour, **stats} for hour, stats in hours.items()
+    ])
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[ParkingLotHourlyStats.parking_lot_id, ParkingLotHourlyStats.hour],
+        set_={
+            'entries': ParkingLotHourlyStats.entries + statement.excluded.entries,
+            'exits': ParkingLotHourlyStats.exits + statement.excluded.exits,
+            'peak_occupancy': func.greatest(ParkingLotHourlyStats.peak_occupancy, statement.excluded.peak_occupancy),
+            'closing_occupancy': statement.excluded.closing_occupancy,
+        }
+    ))
+
+
+async def get_parking_lot_stats(db: AsyncSession, parking_lot_id: int, from_timestamp: datetime,
+                                to_timestamp: datetime, granularity: str):
+    # granularity is validated by the route and is inlined so that the SELECT and GROUP BY expressions match
+    period = func.date_trunc(literal_column(f"'{granularity}'"), ParkingLotHourlyStats.hour).label('period')
+    rows = await db.execute(select(period,
+                                   func.sum(ParkingLotHourlyStats.entries).label('entries'),
+                                   func.sum(ParkingLotHourlyStats.exits).label('exits'),
+                                   func.max(ParkingLotHourlyStats.peak_occupancy).label('peak_occupancy'))
+                            .where(ParkingLotHourlyStats.parking_lot_id == parking_lot_id,
+                                   ParkingLotHourlyStats.hour >= truncate_to_hour(from_timestamp),
+                                   ParkingLotHourlyStats.hour <= to_timestamp)
+                            .group_by(period)
+                            .order_by(period))
+    return rows.mappings().all()
+
+
+BACKFILL_STATEMENT = """
+INSERT INTO parking_lot_hourly_stats (parking_lot_id, hour, entries, exits, peak_occupancy, closing_occupancy)
+SELECT parking_lot_id,
+       hour,
+       count(*) FILTER (WHERE activity_type = 'entry'),
+       count(*) FILTER (WHERE activity_type <> 'entry'),
+       max(CASE WHEN activity_type = 'entry' THEN occupancy ELSE occupancy + 1 END),
+       (array_agg(occupancy ORDER BY timestamp DESC, id DESC))[1]
+FROM (
+    SELECT parking_lot_id,
+           date_trunc('hour', timestamp) AS hour,
+           timestamp,
+           id,
+           activity_type,
+           sum(CASE WHEN activity_type = 'entry' THEN 1 ELSE -1 END)
+               OVER (PARTITION BY parking_lot_id ORDER BY timestamp, id) AS occupancy
+    FROM activity_logs
+    WHERE (CAST(:parking_lot_id AS INTEGER) IS NULL OR parking_lot_id = :parking_lot_id)
+) AS running
+GROUP BY parking_lot_id, hour
+ON CONFLICT (parking_lot_id, hour) DO UPDATE
+SET entries = excluded.entries,
+    exits = excluded.exits,
+    peak_occupancy = excluded.peak_occupancy,
+    closing_occupancy = excluded.closing_occupancy
+"""
+
+
+async def backfill_parking_lot_stats(conn: AsyncConnection, parking_lot_id: Optional[int] = None) -> int:
+    if parking_lot_id is None:
+        await conn.execute(text('TRUNCATE parking_lot_hourly_stats'))
+    else:
+        await lock_parking_lot_stats(conn, parking_lot_id)
+        await conn.execute(text('DELETE FROM parking_lot_hourly_stats WHERE parking_lot_id = :parking_lot_id'),
+                           {'parking_lot_id': parking_lot_id})
+    result = await conn.execute(text(BACKFILL_STATEMENT), {'parking_lot_id': parking_lot_id})
+    return result.rowcount
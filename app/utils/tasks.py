@@ -0,0 +1,15 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(interval: float, func, *args):
+    while True:
+        try:
+            await func(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Periodic task %s failed: %s', func.__name__, e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'auth:invalidate'
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    username: str
+    is_superuser: bool
+    is_active: bool
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            id=user.id,
+            username=user.username,
+            is_superuser=user.is_superuser,
+            is_active=user.is_active,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+            deleted_at=user.deleted_at,
+        )
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf8')).hexdigest()
+
+
+class TokenCache:
+    def __init__(self, max_size: int, max_ttl: int):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._user_digests = {}
+
+    def get(self, token: str):
+        digest = token_digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        expires_at, claims, user = entry
+        if expires_at <= time.time():
+            self._remove(digest)
+            return None
+        self._entries.move_to_end(digest)
+        return claims, user
+
+    def set(self, token: str, claims: dict, user: UserSnapshot):
+        if self.max_size <= 0:
+            return
+        expires_at = min(claims.get('exp', 0), time.time() + self.max_ttl)
+        if expires_at <= time.time():
+            return
+        digest = token_digest(token)
+        self._remove(digest)
+        self._entries[digest] = (expires_at, claims, user)
+        self._user_digests.setdefault(user.id, set()).add(digest)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_token(self, digest: str):
+        self._remove(digest)
+
+    def invalidate_user(self, user_id: int):
+        for digest in self._user_digests.pop(user_id, set()):
+            self._entries.pop(digest, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._user_digests.clear()
+
+    def _remove(self, digest: str):
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        user_id = entry[2].id
+        digests = self._user_digests.get(user_id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._user_digests[user_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache(
+    max_size=int(os.getenv('AUTH_CACHE_MAX_SIZE', 10000)),
+    max_ttl=int(os.getenv('AUTH_CACHE_MAX_TTL_SECONDS', 900)),
+)
+
+
+async def invalidate_user(redis_client: aioredis.Redis, user_id: int):
+    token_cache.invalidate_user(user_id)
+    await redis_client.publish(INVALIDATION_CHANNEL, f'user:{user_id}')
+
+
+async def invalidate_token(redis_client: aioredis.Redis, token: str):
+    digest = token_digest(token)
+    token_cache.invalidate_token(digest)
+    await redis_client.publish(INVALIDATION_CHANNEL, f'token:{digest}')
+
+
+def handle_invalidation(message: str):
+    kind, _, value = message.partition(':')
+    if kind == 'user':
+        token_cache.invalidate_user(int(value))
+    elif kind == 'token':
+        token_cache.invalidate_token(value)
+
+
+async def listen_for_invalidations(redis_client: aioredis.Redis):
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages published while this worker was not subscribed are lost, so start from an empty cache
+            token_cache.clear()
+            async for message in pubsub.listen():
+                handle_invalidation(message['data'].decode('utf8'))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Token invalidation listener failed: %s', e)
+            token_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
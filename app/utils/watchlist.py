@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+from redis import asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import Vehicle
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_CHANNEL = 'watchlist:changes'
+
+
+class Watchlist:
+    # Ids of the tracked vehicles, so that every activity log can be checked with a set lookup. Until the first
+    # load, and after the listener loses its subscription, lookups fall back to the database.
+    def __init__(self):
+        self.vehicle_ids = set()
+        self.loaded = False
+
+    def replace(self, vehicle_ids: set):
+        self.vehicle_ids = vehicle_ids
+        self.loaded = True
+
+    def reset(self):
+        self.loaded = False
+        self.vehicle_ids = set()
+
+    def update(self, vehicle_id: int, tracked: bool):
+        if tracked:
+            self.vehicle_ids.add(vehicle_id)
+        else:
+            self.vehicle_ids.discard(vehicle_id)
+
+    async def tracked(self, db: AsyncSession, vehicle_ids: set) -> set:
+        if self.loaded:
+            return vehicle_ids & self.vehicle_ids
+        return set(await db.scalars(select(Vehicle.id).where(Vehicle.id.in_(vehicle_ids), Vehicle.is_tracked == True)))
+
+
+watchlist = Watchlist()
+
+
+async def load_tracked_vehicle_ids(session_factory) -> set:
+    async with session_factory() as db:
+        return set(await db.scalars(select(Vehicle.id).where(Vehicle.is_tracked == True)))
+
+
+async def watchlist_changed(redis_client: aioredis.Redis, vehicle_id: int, tracked: bool):
+    # Must run after the change is committed, so that a worker reloading the watchlist meanwhile already sees it
+    watchlist.update(vehicle_id, tracked)
+    await redis_client.publish(WATCHLIST_CHANNEL, f'{vehicle_id}:{int(tracked)}')
+
+
+def handle_watchlist_change(message: str):
+    vehicle_id, tracked = message.split(':', 1)
+    watchlist.update(int(vehicle_id), tracked == '1')
+
+
+async def listen_for_watchlist_changes(redis_client: aioredis.Redis, session_factory):
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(WATCHLIST_CHANNEL)
+            # Changes published while this worker was not subscribed are lost, so reload the whole watchlist
+            watchlist.replace(await load_tracked_vehicle_ids(session_factory))
+            async for message in pubsub.listen():
+                handle_watchlist_change(message['data'].decode('utf8'))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Watchlist listener failed: %s', e)
+            watchlist.reset()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
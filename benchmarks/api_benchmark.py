@@ -0,0 +1,202 @@
+from app.configs.load_env import *
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+from sqlalchemy import func, select
+
+from app.dependencies.db_connection import SessionLocal, engine
+from app.dependencies.redis_connection import close_redis_pool, get_redis
+from app.main import app
+from app.models.models import ActivityLog, ParkingLot, ParkingSpace, RatingFeedback, User, Vehicle
+from app.utils.password import password_hasher
+from benchmarks.generate_dataset import ADMIN_USERNAME, BENCHMARK_PASSWORD, username
+
+PAGE_SIZE = 50
+
+
+class Scenario:
+    def __init__(self, name: str, send, admin: bool = False):
+        self.name = name
+        self.send = send
+        self.admin = admin
+
+
+def page(rng):
+    return {'page': rng.randint(1, 10), 'size': PAGE_SIZE}
+
+
+SCENARIOS = [
+    Scenario('login', lambda client, rng, dataset, token: client.post('/login', data={
+        'username': username(rng.randint(1, dataset['users'])),
+        'password': BENCHMARK_PASSWORD
+    })),
+    Scenario('get_parking_spaces', lambda client, rng, dataset, token: client.get('/parking_spaces/', params={
+        'parking_lot_id': rng.randint(1, dataset['parking_lots']), 'size': PAGE_SIZE
+    }, headers=token)),
+    Scenario('get_free_parking_spaces', lambda client, rng, dataset, token: client.get('/parking_spaces/', params={
+        'parking_lot_id': rng.randint(1, dataset['parking_lots']), 'vehicle_type': rng.choice(['car', 'motorbike']),
+        'show_free_only': True, 'size': PAGE_SIZE
+    }, headers=token)),
+    Scenario('get_activity_logs', lambda client, rng, dataset, token: client.get('/activity_logs/', params={
+        'size': PAGE_SIZE
+    }, headers=token)),
+    Scenario('admin_get_activity_logs', lambda client, rng, dataset, token: client.get('/admin/activity_logs/', params={
+        'size': PAGE_SIZE
+    }, headers=token), admin=True),
+    Scenario('admin_get_parking_lot_activity_logs', lambda client, rng, dataset, token: client.get(
+        '/admin/activity_logs/', params={'parking_lot_id': rng.randint(1, dataset['parking_lots']), 'size': PAGE_SIZE},
+        headers=token), admin=True),
+    Scenario('admin_get_parking_lots', lambda client, rng, dataset, token: client.get(
+        '/admin/parking_lots/', params=page(rng), headers=token), admin=True),
+    Scenario('admin_get_vehicles', lambda client, rng, dataset, token: client.get(
+        '/admin/vehicles/', params=page(rng), headers=token), admin=True),
+    Scenario('admin_get_rating_feedbacks', lambda client, rng, dataset, token: client.get(
+        '/admin/ratings_feedbacks/', params=page(rng), headers=token), admin=True),
+]
+
+
+async def count_rows():
+    async with SessionLocal() as db:
+        return {model.__tablename__: await db.scalar(select(func.count()).select_from(model))
+                for model in [User, ParkingLot, ParkingSpace, Vehicle, RatingFeedback, ActivityLog]}
+
+
+async def login(client: httpx.AsyncClient, name: str) -> dict:
+    response = await client.post('/login', data={'username': name, 'password': BENCHMARK_PASSWORD})
+    response.raise_for_status()
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+def summarize(latencies: list, statuses: Counter, elapsed: float) -> dict:
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for code, count in statuses.items() if code >= 400),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+        'throughput': round(len(latencies) / elapsed, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(percentiles[49] * 1000, 3),
+        'p90_ms': round(percentiles[89] * 1000, 3),
+        'p99_ms': round(percentiles[98] * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3)
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, rng, dataset: dict, tokens: list,
+                       requests: int, warmup: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+
+    async def send(record: bool):
+        async with semaphore:
+            token = rng.choice(tokens)
+            start = time.perf_counter()
+            response = await scenario.send(client, rng, dataset, token)
+            if record:
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+
+    await asyncio.gather(*[send(False) for _ in range(warmup)])
+    start = time.perf_counter()
+    await asyncio.gather(*[send(True) for _ in range(requests)])
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict, baseline: dict = None):
+    print(f'{"scenario":>36} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}', end='')
+    print(f' {"p50 vs base":>12} {"p99 vs base":>12}' if baseline else '')
+    for name, result in results.items():
+        print(f'{name:>36} {result["throughput"]:>9.1f} {result["p50_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+              f'{result["errors"]:>7}', end='')
+        base = (baseline or {}).get(name)
+        if base:
+            print(f' {result["p50_ms"] / base["p50_ms"] - 1:>+12.1%} {result["p99_ms"] / base["p99_ms"] - 1:>+12.1%}')
+        else:
+            print()
+
+
+async def main(args):
+    if args.redis == 'fake':
+        import fakeredis
+        redis_client = fakeredis.FakeAsyncRedis()
+        app.dependency_overrides[get_redis] = lambda: redis_client
+    rng = random.Random(args.seed)
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenarios or scenario.name in args.scenarios]
+    try:
+        rows = await count_rows()
+        dataset = {'users': rows['users'], 'parking_lots': rows['parking_lots']}
+        # The app's lifespan is not run, so background listeners and dispatchers do not compete with the requests
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+            admin_tokens = [await login(client, ADMIN_USERNAME)]
+            user_tokens = [await login(client, username(user_id))
+                           for user_id in rng.sample(range(2, rows['users'] + 1), min(args.users, rows['users'] - 1))]
+            results = {}
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(client, scenario, rng, dataset,
+                                                            admin_tokens if scenario.admin else user_tokens,
+                                                            args.requests, args.warmup, args.concurrency)
+    finally:
+        app.dependency_overrides.pop(get_redis, None)
+        password_hasher.shutdown()
+        await close_redis_pool()
+        await engine.dispose()
+
+    report = {
+        'started_at': datetime.utcnow().isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {
+            'seed': args.seed,
+            'redis': args.redis,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'users': args.users
+        },
+        'dataset': rows,
+        'results': results
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as file:
+            baseline = json.load(file)['results']
+    print_results(results, baseline)
+    if args.output == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w', encoding='utf8') as file:
+            json.dump(report, file, indent=2)
+        print(f'Wrote results to {args.output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure latency and throughput of the hot API endpoints in-process')
+    parser.add_argument('--scenarios', nargs='+', choices=[scenario.name for scenario in SCENARIOS])
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests sent before each scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=20, help='number of regular users to send requests as')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--redis', choices=['fake', 'local'], default='fake',
+                        help='use an in-process fake Redis, or the one configured by REDIS_HOST')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON report path, - for stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,211 @@
+from app.configs.load_env import *
+import argparse
+import asyncio
+import random
+import string
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.dependencies.db_connection import create_tables, engine
+from app.models.models import ActivityLog, Camera, ParkingLot, ParkingSpace, RatingFeedback, Sensor, User, Vehicle
+from app.utils.geohash import encode
+from app.utils.license_plates import normalize_license_plate
+from app.utils.partitions import create_partitions
+from app.utils.password import hash_password_sync
+from app.utils.ratings import rebuild_rating_aggregates
+from app.utils.stats import backfill_parking_lot_stats
+
+BENCHMARK_PASSWORD = 'benchmark'
+ADMIN_USERNAME = 'admin'
+VEHICLE_TYPES = ['car', 'motorbike', 'truck']
+# Lots are spread over a box around Hanoi, roughly 20 km across
+CENTER_LATITUDE = 21.03
+CENTER_LONGITUDE = 105.85
+SPREAD_DEGREES = 0.1
+
+TABLES = [User, ParkingLot, Camera, Vehicle, ParkingSpace, Sensor, RatingFeedback, ActivityLog]
+SERIAL_TABLES = [User, ParkingLot, Vehicle, ParkingSpace, RatingFeedback, ActivityLog]
+
+
+def username(user_id: int) -> str:
+    return ADMIN_USERNAME if user_id == 1 else f'user{user_id}'
+
+
+def random_uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def random_api_key(rng: random.Random) -> str:
+    return f'{rng.getrandbits(256):064x}'
+
+
+def generate_users(rng, count: int, hashed_password: str, now: datetime):
+    # Every user shares one password so that the API benchmark can log in as any of them
+    for user_id in range(1, count + 1):
+        yield user_id, username(user_id), hashed_password, user_id == 1, now - timedelta(days=rng.randint(0, 365)), True
+
+
+def generate_parking_lots(rng, count: int, now: datetime):
+    for parking_lot_id in range(1, count + 1):
+        latitude = CENTER_LATITUDE + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        longitude = CENTER_LONGITUDE + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        yield parking_lot_id, f'Parking lot {parking_lot_id}', longitude, latitude, encode(latitude, longitude), \
+            now - timedelta(days=rng.randint(0, 365)), True
+
+
+def generate_cameras(rng, parking_lots: int, per_lot: int, now: datetime):
+    for parking_lot_id in range(1, parking_lots + 1):
+        for _ in range(per_lot):
+            yield random_uuid(rng), random_api_key(rng), parking_lot_id, now, True
+
+
+def generate_vehicles(rng, count: int, users: int, now: datetime):
+    for vehicle_id in range(1, count + 1):
+        license_plate = f'{rng.randint(10, 99)}{rng.choice(string.ascii_uppercase)}-{vehicle_id:06d}'
+        yield vehicle_id, license_plate, normalize_license_plate(license_plate), rng.choice(VEHICLE_TYPES), False, \
+            rng.randint(1, users), now - timedelta(days=rng.randint(0, 365))
+
+
+def generate_parking_spaces(rng, parking_lots: list, per_lot: int, occupancy: float, now: datetime):
+    parking_space_id = 0
+    for parking_lot_id, longitude, latitude in parking_lots:
+        for _ in range(per_lot):
+            parking_space_id += 1
+            state = 'occupied' if rng.random() < occupancy else 'free'
+            yield parking_space_id, longitude + rng.uniform(-0.0005, 0.0005), \
+                latitude + rng.uniform(-0.0005, 0.0005), rng.choice(VEHICLE_TYPES), state, parking_lot_id, now, True
+
+
+def generate_sensors(rng, parking_spaces: int, now: datetime):
+    for parking_space_id in range(1, parking_spaces + 1):
+        yield random_uuid(rng), random_api_key(rng), parking_space_id, now, True
+
+
+def generate_ratings(rng, count: int, users: int, parking_lots: int, now: datetime):
+    for rating_id in range(1, count + 1):
+        feedback = rng.choice([None, 'Easy to find', 'Too crowded', 'Friendly staff', 'Hard to park'])
+        yield rating_id, rng.randint(1, users), rng.randint(1, parking_lots), rng.randint(1, 5), feedback, \
+            now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)), True
+
+
+def generate_activity_logs(rng, count: int, vehicles: int, parking_lots: int, start: datetime, now: datetime):
+    # Each visit is an entry followed by an exit a few hours later, at a random lot
+    seconds = int((now - start).total_seconds())
+    activity_log_id = 0
+    while activity_log_id < count:
+        vehicle_id = rng.randint(1, vehicles)
+        parking_lot_id = rng.randint(1, parking_lots)
+        entry_time = start + timedelta(seconds=rng.randint(0, seconds))
+        exit_time = min(entry_time + timedelta(minutes=rng.randint(5, 8 * 60)), now)
+        activity_log_id += 1
+        yield activity_log_id, 'entry', vehicle_id, entry_time, parking_lot_id
+        if activity_log_id < count:
+            activity_log_id += 1
+            yield activity_log_id, 'exit', vehicle_id, exit_time, parking_lot_id
+
+
+def batched(records, batch_size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def copy_records(connection, model, columns: list, records, batch_size: int) -> int:
+    start = time.perf_counter()
+    row_count = 0
+    for batch in batched(records, batch_size):
+        await connection.copy_records_to_table(model.__tablename__, records=batch, columns=columns)
+        row_count += len(batch)
+    print(f'{model.__tablename__:>20} {row_count:>12} rows {time.perf_counter() - start:>8.1f}s')
+    return row_count
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    activity_log_start = now - timedelta(days=args.days)
+    months_behind = (now.year - activity_log_start.year) * 12 + now.month - activity_log_start.month
+    parking_spaces = args.parking_lots * args.spaces_per_lot
+    try:
+        await create_tables()
+        async with engine.begin() as conn:
+            if args.truncate:
+                await conn.execute(text(f'TRUNCATE {", ".join(model.__tablename__ for model in TABLES)}, '
+                                        f'parking_lot_hourly_stats, outbox_events RESTART IDENTITY CASCADE'))
+            else:
+                for model in TABLES:
+                    if (await conn.execute(text(f'SELECT EXISTS (SELECT 1 FROM {model.__tablename__})'))).scalar():
+                        raise SystemExit(f'{model.__tablename__} is not empty, rerun with --truncate to replace it')
+            await create_partitions(conn, months_behind=months_behind)
+
+            raw_connection = await conn.get_raw_connection()
+            connection = raw_connection.driver_connection
+            await copy_records(connection, User, ['id', 'username', 'password', 'is_superuser', 'created_at',
+                                                  'is_active'],
+                               generate_users(rng, args.users, hash_password_sync(BENCHMARK_PASSWORD), now),
+                               args.batch_size)
+            parking_lots = list(generate_parking_lots(rng, args.parking_lots, now))
+            await copy_records(connection, ParkingLot, ['id', 'name', 'longitude', 'latitude', 'geohash',
+                                                        'created_at', 'is_active'],
+                               parking_lots, args.batch_size)
+            await copy_records(connection, Camera, ['id', 'api_key', 'parking_lot_id', 'created_at', 'is_active'],
+                               generate_cameras(rng, args.parking_lots, args.cameras_per_lot, now), args.batch_size)
+            await copy_records(connection, Vehicle, ['id', 'license_plate', 'normalized_license_plate', 'vehicle_type',
+                                                     'is_tracked', 'owner_id', 'created_at'],
+                               generate_vehicles(rng, args.vehicles, args.users, now), args.batch_size)
+            await copy_records(connection, ParkingSpace, ['id', 'longitude', 'latitude', 'vehicle_type', 'state',
+                                                          'parking_lot_id', 'created_at', 'is_active'],
+                               generate_parking_spaces(rng, [(lot[0], lot[2], lot[3]) for lot in parking_lots],
+                                                       args.spaces_per_lot, args.occupancy, now),
+                               args.batch_size)
+            await copy_records(connection, Sensor, ['id', 'api_key', 'parking_space_id', 'created_at', 'is_active'],
+                               generate_sensors(rng, parking_spaces, now), args.batch_size)
+            await copy_records(connection, RatingFeedback, ['id', 'user_id', 'parking_lot_id', 'rating', 'feedback',
+                                                            'created_at', 'is_active'],
+                               generate_ratings(rng, args.ratings, args.users, args.parking_lots, now),
+                               args.batch_size)
+            await copy_records(connection, ActivityLog, ['id', 'activity_type', 'vehicle_id', 'timestamp',
+                                                         'parking_lot_id'],
+                               generate_activity_logs(rng, args.activity_logs, args.vehicles, args.parking_lots,
+                                                      activity_log_start, now),
+                               args.batch_size)
+
+            # Rows were copied with explicit ids, so move every sequence past them
+            for model in SERIAL_TABLES:
+                await conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                                        f"coalesce(max(id), 0) + 1, false) FROM {model.__tablename__}"))
+            await rebuild_rating_aggregates(conn)
+            await backfill_parking_lot_stats(conn)
+            await conn.execute(text('ANALYZE'))
+        print(f'Generated dataset with seed {args.seed}, log in as {ADMIN_USERNAME} or user2..user{args.users} '
+              f'with password {BENCHMARK_PASSWORD!r}')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Populate the database with a reproducible synthetic dataset')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--parking-lots', type=int, default=200)
+    parser.add_argument('--spaces-per-lot', type=int, default=100)
+    parser.add_argument('--cameras-per-lot', type=int, default=2)
+    parser.add_argument('--vehicles', type=int, default=20000)
+    parser.add_argument('--ratings', type=int, default=50000)
+    parser.add_argument('--activity-logs', type=int, default=2000000)
+    parser.add_argument('--days', type=int, default=90, help='spread activity logs over this many past days')
+    parser.add_argument('--occupancy', type=float, default=0.4, help='share of parking spaces that are occupied')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--truncate', action='store_true', help='empty the tables before generating')
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error('--users must be at least 2')
+    asyncio.run(main(args))
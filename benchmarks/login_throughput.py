@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+import time
+
+from app.utils.password import PasswordHasher, hash_password_sync, verify_password_sync
+
+PASSWORD = 'correct horse battery staple'
+
+
+async def run_verifications(verify, hashed_password: str, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            assert await verify(PASSWORD, hashed_password)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(requests)])
+    return time.perf_counter() - start
+
+
+async def main(worker_counts, requests: int, concurrency: int):
+    hashed_password = hash_password_sync(PASSWORD)
+    print(f'{"pool":>12} {"logins/s":>10} {"speedup":>8}')
+
+    async def verify_in_thread(plain_password, hashed):
+        return await asyncio.to_thread(verify_password_sync, plain_password, hashed)
+
+    elapsed = await run_verifications(verify_in_thread, hashed_password, requests, concurrency)
+    print(f'{"threadpool":>12} {requests / elapsed:>10.1f} {"":>8}')
+
+    baseline = None
+    for workers in worker_counts:
+        hasher = PasswordHasher(max_workers=workers, max_pending=concurrency)
+        try:
+            # Start the worker processes before timing
+            await asyncio.gather(*[hasher.verify(PASSWORD, hashed_password) for _ in range(workers)])
+            elapsed = await run_verifications(hasher.verify, hashed_password, requests, concurrency)
+        finally:
+            hasher.shutdown()
+        throughput = requests / elapsed
+        baseline = baseline or throughput
+        print(f'{f"{workers} procs":>12} {throughput:>10.1f} {throughput / baseline:>7.2f}x')
+
+
+if __name__ == '__main__':
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({1, *[2 ** i for i in range(1, cpu_count.bit_length()) if 2 ** i < cpu_count], cpu_count})
+    parser = argparse.ArgumentParser(description='Measure password verification throughput by process pool size')
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.requests, args.concurrency))
@@ -0,0 +1,94 @@
+from app.configs.load_env import *
+import argparse
+import asyncio
+import random
+import sys
+
+import httpx
+
+from app.dependencies.db_connection import engine
+from app.dependencies.redis_connection import close_redis_pool, get_redis
+from app.main import app
+from app.utils.password import password_hasher
+from app.utils.query_counter import assert_max_queries
+from benchmarks.api_benchmark import PAGE_SIZE, count_rows, login
+from benchmarks.generate_dataset import ADMIN_USERNAME, username
+
+
+class Check:
+    def __init__(self, name: str, path, params, max_queries: int, admin: bool = False):
+        self.name = name
+        self.path = path
+        self.params = params
+        self.max_queries = max_queries
+        self.admin = admin
+
+
+def random_parking_lot_id(rng, dataset):
+    return rng.randint(1, dataset['parking_lots'])
+
+
+# A full page issues a fixed number of statements: authentication, the page, its total and the loads of the
+# nested relationships. A lazy load per row would exceed these limits by the page size.
+CHECKS = [
+    Check('get_activity_logs', lambda rng, dataset: '/activity_logs/',
+          lambda rng, dataset: {'size': PAGE_SIZE}, max_queries=3),
+    Check('admin_get_activity_logs', lambda rng, dataset: '/admin/activity_logs/',
+          lambda rng, dataset: {'size': PAGE_SIZE}, max_queries=3, admin=True),
+    Check('get_rating_feedbacks',
+          lambda rng, dataset: f'/parking-lots/{random_parking_lot_id(rng, dataset)}/rating-feedbacks/',
+          lambda rng, dataset: {'size': PAGE_SIZE}, max_queries=4),
+    Check('admin_get_rating_feedbacks', lambda rng, dataset: '/admin/ratings_feedbacks/',
+          lambda rng, dataset: {'size': PAGE_SIZE}, max_queries=4, admin=True),
+    Check('get_parking_spaces', lambda rng, dataset: '/parking_spaces/',
+          lambda rng, dataset: {'parking_lot_id': random_parking_lot_id(rng, dataset), 'size': PAGE_SIZE},
+          max_queries=4),
+]
+
+
+async def run_check(client: httpx.AsyncClient, check: Check, rng, dataset: dict, token: dict):
+    path = check.path(rng, dataset)
+    params = check.params(rng, dataset)
+    # The first request fills the authentication and pagination total caches, the second is counted
+    await client.get(path, params=params, headers=token)
+    with assert_max_queries(engine, check.max_queries) as statements:
+        response = await client.get(path, params=params, headers=token)
+    response.raise_for_status()
+    return len(statements)
+
+
+async def main(args) -> bool:
+    if args.redis == 'fake':
+        import fakeredis
+        redis_client = fakeredis.FakeAsyncRedis()
+        app.dependency_overrides[get_redis] = lambda: redis_client
+    rng = random.Random(args.seed)
+    passed = True
+    try:
+        rows = await count_rows()
+        dataset = {'users': rows['users'], 'parking_lots': rows['parking_lots']}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+            admin_token = await login(client, ADMIN_USERNAME)
+            user_token = await login(client, username(rng.randint(2, rows['users'])))
+            for check in CHECKS:
+                try:
+                    count = await run_check(client, check, rng, dataset, admin_token if check.admin else user_token)
+                    print(f'{check.name:>28} {count:>3} statements (max {check.max_queries})')
+                except AssertionError as e:
+                    passed = False
+                    print(f'{check.name:>28} FAILED: {e}')
+    finally:
+        app.dependency_overrides.pop(get_redis, None)
+        password_hasher.shutdown()
+        await close_redis_pool()
+        await engine.dispose()
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the number of SQL statements issued by the list endpoints')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--redis', choices=['fake', 'local'], default='fake',
+                        help='use an in-process fake Redis, or the one configured by REDIS_HOST')
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from fastapi_pagination import Page, Params
+from fastapi_pagination.utils import create_pydantic_model
+
+from app.models.models import ActivityLog, ParkingLot, ParkingSpace, User, Vehicle
+from app.models.schemas import ActivityLogAdminOut, ParkingSpaceAdminOut
+from app.utils.pagination import CursorPage
+from app.utils.serialization import serialize
+
+
+def create_parking_lot(now: datetime):
+    return ParkingLot(id=1, name='Lot 1', longitude=105.8, latitude=21.0, rating_count=0, rating_average=0,
+                      is_active=True, created_at=now)
+
+
+def activity_log_page(size: int):
+    now = datetime.utcnow()
+    parking_lot = create_parking_lot(now)
+    items = []
+    for i in range(size):
+        owner = User(id=i, username=f'user{i}', is_active=True)
+        vehicle = Vehicle(id=i, license_plate=f'30A-{i:05d}', vehicle_type='car', created_at=now, is_tracked=False,
+                          owner=owner)
+        items.append(ActivityLog(id=i, activity_type='entry', timestamp=now - timedelta(minutes=i),
+                                 parking_lot=parking_lot, vehicle=vehicle))
+    return {'items': items, 'size': size, 'next_cursor': 'WyIyMDI0LTAxLTAxVDAwOjAwOjAwIiwgMTAwXQ=='}
+
+
+def parking_space_page(size: int):
+    now = datetime.utcnow()
+    parking_lot = create_parking_lot(now)
+    items = [ParkingSpace(id=i, longitude=105, latitude=21, parking_lot_id=1, vehicle_type='car', state='free',
+                          is_active=True, created_at=now, vehicle=None, parking_lot=parking_lot) for i in range(size)]
+    return create_pydantic_model(Page[ParkingSpaceAdminOut], items=items, total=size * 10, page=1, size=size,
+                                 pages=10)
+
+
+async def default_path(schema, content) -> bytes:
+    field = create_response_field(name='Response', type_=schema)
+    return JSONResponse(await serialize_response(field=field, response_content=content, is_coroutine=True)).body
+
+
+async def measure(name: str, schema, content, rounds: int):
+    before = await default_path(schema, content)
+    after = serialize(schema, content)
+    assert json.loads(before) == json.loads(after)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await default_path(schema, content)
+    default_time = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        serialize(schema, content)
+    fast_time = (time.perf_counter() - start) / rounds
+
+    print(f'{name:>32} {default_time * 1000:>12.3f} {fast_time * 1000:>12.3f} {default_time / fast_time:>8.1f}x')
+
+
+async def main(size: int, rounds: int):
+    print(f'{"page":>32} {"default ms":>12} {"fast ms":>12} {"speedup":>8}')
+    await measure('CursorPage[ActivityLogAdminOut]', CursorPage[ActivityLogAdminOut], activity_log_page(size), rounds)
+    await measure('Page[ParkingSpaceAdminOut]', Page[ParkingSpaceAdminOut], parking_space_page(size), rounds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-page serialisation time of admin list responses')
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.size, args.rounds))